@@ -0,0 +1,25 @@
+from common.comm import encode_frame, decode_frame
+from common.message import decode, decode_routed, ReqInf, ResInf
+from .utils import time_per_call, print_table
+
+# run measures what the server spends on each forwarded REQ_INF and RES_INF:
+# decoding and encoding the message again, against routing it on its header.
+def run(args):
+    msgs = [
+        ReqInf(originid="01", destid="02"),
+        ResInf(originid="02", destid="01", payload="27.31"),
+    ]
+
+    rows = []
+    for msg in msgs:
+        frame = encode_frame(msg.encode())
+        decode_us = time_per_call(
+            lambda: decode(decode_frame(frame)).encode()) * 1e6
+        route_us = time_per_call(
+            lambda: decode_routed(decode_frame(frame)).body) * 1e6
+        rows.append([msg.MSG_NAME, len(frame), f"{decode_us:.2f}",
+                     f"{route_us:.2f}", f"{decode_us / route_us:.1f}"])
+
+    print("Forwarding cost per frame")
+    print_table(["msg", "bytes", "decode_encode_us", "route_us", "speedup"],
+                rows)
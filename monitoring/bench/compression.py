@@ -0,0 +1,51 @@
+from common.comm import encode_frame, decode_frame
+from common.message import ResList, ReqInf
+from common.utils import get_option
+from .utils import time_per_call, print_table
+
+FLEET_SIZES = [100, 1000, 10000]
+LEVELS = [1, 6, 9]
+
+# run measures the bytes saved by compressing RES_LIST frames against the CPU
+# spent compressing and decompressing them, for several fleet sizes.
+def run(args):
+    fleet_sizes = FLEET_SIZES
+    sizes = get_option(args, "-fleet-sizes")
+    if sizes != None:
+        fleet_sizes = [int(size) for size in sizes.split(",")]
+
+    rows = []
+    for fleet_size in fleet_sizes:
+        body = res_list_body(fleet_size)
+        plain = encode_frame(body)
+        encode_us = time_per_call(lambda: encode_frame(body)) * 1e6
+        decode_us = time_per_call(lambda: decode_frame(plain)) * 1e6
+        rows.append([fleet_size, "none", len(plain), "1.00",
+                     f"{encode_us:.1f}", f"{decode_us:.1f}"])
+
+        for level in LEVELS:
+            frame = encode_frame(body, compress=True, level=level)
+            encode_us = time_per_call(
+                lambda: encode_frame(body, compress=True, level=level)) * 1e6
+            decode_us = time_per_call(lambda: decode_frame(frame)) * 1e6
+            rows.append([fleet_size, f"zlib-{level}", len(frame),
+                         f"{len(plain) / len(frame):.2f}",
+                         f"{encode_us:.1f}", f"{decode_us:.1f}"])
+
+    print("RES_LIST frames")
+    print_table(["fleet", "codec", "bytes", "ratio", "encode_us", "decode_us"],
+                rows)
+
+    # Small frames stay below the threshold and skip compression entirely.
+    body = ReqInf(originid="01", destid="02").encode()
+    plain_us = time_per_call(lambda: encode_frame(body)) * 1e6
+    compress_us = time_per_call(lambda: encode_frame(body, compress=True)) * 1e6
+    print()
+    print(f"REQ_INF frame ({len(encode_frame(body))} bytes): encode "+
+          f"{plain_us:.2f} us plain, {compress_us:.2f} us with compression "+
+          f"enabled")
+
+def res_list_body(fleet_size):
+    width = len(str(fleet_size))
+    equipids = ["{:0{}d}".format(i, width) for i in range(1, fleet_size+1)]
+    return ResList(payload=" ".join(equipids)).encode()
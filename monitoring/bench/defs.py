@@ -0,0 +1 @@
+LOGGER_NAME = "industry50-bench"
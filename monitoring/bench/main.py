@@ -0,0 +1,30 @@
+import sys
+
+from common import log
+from . import codec, compression, membership, priority, tls, transport
+
+logger = log.logger('industry50-bench')
+
+BENCHMARKS = {
+    "codec": codec.run,
+    "compression": compression.run,
+    "membership": membership.run,
+    "priority": priority.run,
+    "tls": tls.run,
+    "transport": transport.run,
+}
+
+def main():
+    try:
+        log.parse_config_log_level(sys.argv[1:])
+
+        name = sys.argv[1]
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark '{name}'. Should be one of "+
+                             f"{list(BENCHMARKS.keys())}")
+
+        logger.info(f"Running benchmark {name} with arguments {sys.argv[2:]}")
+        BENCHMARKS[name](sys.argv[2:])
+
+    except Exception as e:
+        logger.critical(f"Encountered fatal error: {e}", exc_info=True)
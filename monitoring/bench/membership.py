@@ -0,0 +1,100 @@
+import math
+import selectors
+import time
+
+from common.comm import new_socket, send_msg, recv_frame, decode_frame
+from common.message import decode, ReqAdd, ReqRem, ResAdd
+from common.utils import get_option
+from server.limits import MAX_EQUIPMENTS, BROADCAST_WINDOW
+from .utils import free_port, start_server, stop_server, print_table
+
+NUM_JOINS = 1000
+# IDLE_TIMEOUT is how long the connections stay quiet before a storm is
+# considered announced. It must exceed the broadcast windows.
+IDLE_TIMEOUT = 0.2 # Seconds
+
+# run counts the frames and bytes the server sends while equipments join and
+# leave all at once, with and without coalesced membership broadcasts. The
+# server only admits MAX_EQUIPMENTS equipments, so the joins are split in
+# storms of that size.
+def run(args):
+    num_joins = int(get_option(args, "-joins", NUM_JOINS))
+    windows = [0, BROADCAST_WINDOW]
+    option = get_option(args, "-windows")
+    if option != None:
+        windows = [float(window) / 1e3 for window in option.split(",")]
+
+    num_storms = math.ceil(num_joins / MAX_EQUIPMENTS)
+    rows = []
+    for window in windows:
+        port = free_port()
+        server = start_server(port, [f"-broadcast-window={window * 1e3}"])
+        try:
+            counter = Counter()
+            start = time.perf_counter()
+            for _ in range(num_storms):
+                storm(port, counter)
+            elapsed = time.perf_counter() - start
+        finally:
+            stop_server(server)
+
+        total_joins = num_storms * MAX_EQUIPMENTS
+        rows.append([f"{window * 1e3:g}", total_joins, counter.frames,
+                     counter.bytes, f"{counter.frames / total_joins:.1f}",
+                     f"{elapsed:.2f}"])
+
+    print(f"Frames sent by the server for {num_storms} storms of "+
+          f"{MAX_EQUIPMENTS} equipments joining and leaving at once")
+    print_table(["window_ms", "joins", "frames", "bytes", "frames_per_join",
+                 "seconds"], rows)
+
+class Counter:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def count(self, frame):
+        self.frames += 1
+        self.bytes += len(frame)
+
+def storm(port, counter):
+    selector = selectors.DefaultSelector()
+    socks = []
+    for _ in range(MAX_EQUIPMENTS):
+        sock = new_socket()
+        sock.connect(("127.0.0.1", port))
+        selector.register(sock, selectors.EVENT_READ)
+        socks.append(sock)
+
+    # The first RES_ADD each equipment gets carries its own id.
+    equipids = {}
+    def on_join(sock, msg):
+        if msg.msgid == ResAdd.MSGID and sock not in equipids:
+            equipids[sock] = msg.equipid()
+
+    for sock in socks:
+        send_msg(sock, ReqAdd())
+    drain(selector, counter, on_join)
+
+    for sock in socks:
+        send_msg(sock, ReqRem(originid=equipids[sock]))
+    # The server closes each connection after answering its removal.
+    drain(selector, counter, lambda sock, msg: None)
+
+    for sock in socks:
+        sock.close()
+    selector.close()
+
+def drain(selector, counter, on_msg):
+    while len(selector.get_map()) > 0:
+        events = selector.select(IDLE_TIMEOUT)
+        if len(events) == 0:
+            return
+        for key, _ in events:
+            try:
+                frame = recv_frame(key.fileobj)
+            except (ConnectionResetError, OSError):
+                selector.unregister(key.fileobj)
+                continue
+            counter.count(frame)
+            on_msg(key.fileobj, decode(decode_frame(frame)))
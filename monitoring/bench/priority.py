@@ -0,0 +1,162 @@
+import multiprocessing
+import socket
+import threading
+import time
+
+from common.comm import new_socket, send_msg, recv_msg
+from common.message import ReqAdd, ReqRem, ResAdd, ReqInf
+from common.utils import get_option, percentile
+from .utils import free_port, start_server, stop_server, print_table
+
+NUM_FLOODERS = 2
+NUM_PROBES = 30
+PROBE_INTERVAL = 0.02 # Seconds
+PROBE_TIMEOUT = 1.0 # Seconds
+# OBSERVER_FRAME_COST is the time the observer spends on each frame, so that
+# frames queue up in the server, as for a busy equipment.
+OBSERVER_FRAME_COST = 50e-6 # Seconds
+OBSERVER_RCVBUF = 4 * 1024 # Bytes
+
+# run measures how long membership changes take to reach an equipment flooded
+# with REQ_INF, with the server's priority lanes on and off.
+def run(args):
+    num_flooders = int(get_option(args, "-flooders", NUM_FLOODERS))
+    num_probes = int(get_option(args, "-probes", NUM_PROBES))
+
+    rows = []
+    for lanes in ["on", "off"]:
+        port = free_port()
+        # Rate limiting is disabled so that the flood reaches the observer,
+        # and membership changes are announced right away.
+        server = start_server(port, [f"-priority-lanes={lanes}",
+                                     "-origin-rate=0", "-dest-rate=0",
+                                     "-broadcast-window=0"])
+        try:
+            latencies, num_lost, data_rate = measure(port, num_flooders,
+                                                     num_probes)
+        finally:
+            stop_server(server)
+
+        # Lost messages took longer than PROBE_TIMEOUT.
+        latencies += [PROBE_TIMEOUT] * num_lost
+        latencies.sort()
+        rows.append([lanes, len(latencies), num_lost, f"{data_rate:.0f}",
+                     f"{percentile(latencies, 50) * 1e3:.2f}",
+                     f"{percentile(latencies, 99) * 1e3:.2f}",
+                     f"{latencies[-1] * 1e3:.2f}"])
+
+    print(f"Control latency (RES_ADD and REQ_REM) under REQ_INF load from "+
+          f"{num_flooders} equipments")
+    print_table(["lanes", "control_msgs", "lost", "data_per_s", "p50_ms",
+                 "p99_ms", "max_ms"], rows)
+
+class Observer:
+    def __init__(self, port):
+        self.sock = new_socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                             OBSERVER_RCVBUF)
+        self.sock.connect(("127.0.0.1", port))
+        self.equipid = join(self.sock)
+
+        self.num_data = 0
+        self._cond = threading.Condition()
+        # _events is map (msgid, equipid) -> time the observer got the message
+        self._events = {}
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def wait_event(self, msgid, equipid, since, timeout):
+        deadline = since + timeout
+        with self._cond:
+            while True:
+                event_time = self._events.pop((msgid, equipid), None)
+                if event_time != None and event_time >= since:
+                    return event_time
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def _read_loop(self):
+        try:
+            while True:
+                msg = recv_msg(self.sock)
+                now = time.perf_counter()
+                if msg.msgid == ReqInf.MSGID:
+                    self.num_data += 1
+                    spin(OBSERVER_FRAME_COST)
+                    continue
+                if msg.msgid == ResAdd.MSGID:
+                    key = (msg.msgid, msg.equipid())
+                else:
+                    key = (msg.msgid, msg.originid)
+                with self._cond:
+                    self._events[key] = now
+                    self._cond.notify_all()
+        except (ConnectionResetError, OSError):
+            pass
+
+def measure(port, num_flooders, num_probes):
+    observer = Observer(port)
+
+    # Flooders run in their own processes, so they do not compete with the
+    # observer for the interpreter lock.
+    flooders = []
+    for _ in range(num_flooders):
+        flooder = multiprocessing.Process(target=flood,
+                                          args=(port, observer.equipid),
+                                          daemon=True)
+        flooder.start()
+        flooders.append(flooder)
+
+    # Let the server's queues fill up before probing.
+    start = time.perf_counter()
+    time.sleep(0.5)
+
+    latencies = []
+    num_lost = 0
+    for _ in range(num_probes):
+        sock = new_socket()
+        sock.connect(("127.0.0.1", port))
+        add_start = time.perf_counter()
+        equipid = join(sock)
+        added = observer.wait_event(ResAdd.MSGID, equipid, add_start,
+                                    PROBE_TIMEOUT)
+
+        rem_start = time.perf_counter()
+        send_msg(sock, ReqRem(originid=equipid))
+        removed = observer.wait_event(ReqRem.MSGID, equipid, rem_start,
+                                      PROBE_TIMEOUT)
+        sock.close()
+
+        for event_time, sent in [(added, add_start), (removed, rem_start)]:
+            if event_time == None:
+                num_lost += 1
+            else:
+                latencies.append(event_time - sent)
+        time.sleep(PROBE_INTERVAL)
+
+    for flooder in flooders:
+        flooder.kill()
+        flooder.join()
+    observer.sock.close()
+    data_rate = observer.num_data / (time.perf_counter() - start)
+    return latencies, num_lost, data_rate
+
+def flood(port, destid):
+    sock = new_socket()
+    sock.connect(("127.0.0.1", port))
+    msg = ReqInf(originid=join(sock), destid=destid)
+    while True:
+        send_msg(sock, msg)
+
+def join(sock):
+    send_msg(sock, ReqAdd())
+    equipid = recv_msg(sock).equipid()
+    recv_msg(sock) # RES_LIST
+    return equipid
+
+def spin(duration):
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        pass
@@ -0,0 +1,119 @@
+import os
+import subprocess
+import tempfile
+import time
+
+from common.comm import new_socket, send_msg, recv_msg
+from common.message import ReqAdd, ReqRem, ReqInf, ResInf
+from common.utils import get_option
+from common import tls
+from .utils import free_port, start_server, stop_server, print_table
+
+GEN_CERTS = os.path.join(os.path.dirname(__file__), "..", "..", "scripts",
+                         "gen-test-certs.sh")
+
+NUM_CONNECTIONS = 200
+NUM_ROUND_TRIPS = 2000
+
+# run measures the connection rate (connect, register, remove) and the cost of
+# a REQ_INF/RES_INF round trip between two equipments, with and without TLS.
+def run(args):
+    num_conns = int(get_option(args, "-connections", NUM_CONNECTIONS))
+    num_round_trips = int(get_option(args, "-round-trips", NUM_ROUND_TRIPS))
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        subprocess.run(["bash", GEN_CERTS, cert_dir], check=True)
+        cert = os.path.join(cert_dir, "test-cert.pem")
+        key = os.path.join(cert_dir, "test-key.pem")
+
+        tcp_port = free_port()
+        tls_port = free_port()
+        # Rate limiting is disabled, as the round trips exceed its rates.
+        no_limits = ["-origin-rate=0", "-dest-rate=0"]
+        tcp_server = start_server(tcp_port, no_limits)
+        tls_server = start_server(tls_port, [f"-tls-cert={cert}",
+                                             f"-tls-key={key}"] + no_limits)
+        try:
+            modes = [
+                ("tcp", tcp_port, None, None),
+                ("tls-full", tls_port, tls.client_context(cert), None),
+            ]
+            resumed_ctx = tls.client_context(cert)
+            modes.append(("tls-resumed", tls_port, resumed_ctx,
+                          tls.SessionCache()))
+
+            rows = []
+            for name, port, ctx, sessions in modes:
+                elapsed, num_resumed = connection_rate(port, ctx, sessions,
+                                                       num_conns)
+                rows.append([name, num_conns, num_resumed,
+                             f"{num_conns / elapsed:.0f}",
+                             f"{elapsed / num_conns * 1e3:.3f}"])
+            print("Connections (connect, register, remove)")
+            print_table(["mode", "conns", "resumed", "conns_per_s", "ms_per_conn"],
+                        rows)
+
+            rows = []
+            for name, port, ctx, _ in modes[:2]:
+                elapsed = round_trips(port, ctx, num_round_trips)
+                rows.append([name, num_round_trips,
+                             f"{elapsed / num_round_trips * 1e6:.1f}"])
+            print()
+            print("REQ_INF/RES_INF round trips through the server")
+            print_table(["mode", "round_trips", "us_per_round_trip"], rows)
+        finally:
+            stop_server(tcp_server)
+            stop_server(tls_server)
+
+def connect(port, ctx, sessions):
+    sock = new_socket()
+    sock.connect(("127.0.0.1", port))
+    if ctx != None:
+        sock = tls.wrap_client(ctx, sock, "127.0.0.1", port, sessions)
+    return sock
+
+def join(sock):
+    send_msg(sock, ReqAdd())
+    equipid = recv_msg(sock).equipid()
+    recv_msg(sock) # RES_LIST
+    return equipid
+
+def leave(sock, equipid):
+    send_msg(sock, ReqRem(originid=equipid))
+    recv_msg(sock) # OK
+    sock.close()
+
+def connection_rate(port, ctx, sessions, num_conns):
+    num_resumed = 0
+    start = time.perf_counter()
+    for _ in range(num_conns):
+        sock = connect(port, ctx, sessions)
+        equipid = join(sock)
+        if ctx != None:
+            if sock.session_reused:
+                num_resumed += 1
+            if sessions != None:
+                sessions.store("127.0.0.1", port, sock)
+        leave(sock, equipid)
+    return time.perf_counter() - start, num_resumed
+
+def round_trips(port, ctx, num_round_trips):
+    sock_a = connect(port, ctx, None)
+    equipid_a = join(sock_a)
+    sock_b = connect(port, ctx, None)
+    equipid_b = join(sock_b)
+    recv_msg(sock_a) # RES_ADD for b
+
+    start = time.perf_counter()
+    for _ in range(num_round_trips):
+        send_msg(sock_a, ReqInf(originid=equipid_a, destid=equipid_b))
+        recv_msg(sock_b)
+        send_msg(sock_b, ResInf(originid=equipid_b, destid=equipid_a,
+                                payload="1.0"))
+        recv_msg(sock_a)
+    elapsed = time.perf_counter() - start
+
+    leave(sock_b, equipid_b)
+    recv_msg(sock_a) # REQ_REM for b
+    leave(sock_a, equipid_a)
+    return elapsed
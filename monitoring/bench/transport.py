@@ -0,0 +1,130 @@
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+
+from common.comm import new_socket, send_msg, recv_msg
+from common.message import ReqAdd, ReqRem, ReqInf, ResInf, Ok
+from common.utils import get_option
+from .utils import free_port, start_server, stop_server, print_table
+
+NUM_ROUND_TRIPS = 1000
+NUM_MESSAGES = 10000
+# Transports are measured in turns, NUM_REPEATS times, and the best result of
+# each is kept, as the host's load varies over the run.
+NUM_REPEATS = 5
+
+# run compares TCP over the loopback with a Unix socket for equipments on the
+# server's host: the REQ_INF/RES_INF round trip latency and the REQ_INF
+# throughput from one equipment to another.
+def run(args):
+    num_round_trips = int(get_option(args, "-round-trips", NUM_ROUND_TRIPS))
+    num_msgs = int(get_option(args, "-messages", NUM_MESSAGES))
+    num_repeats = int(get_option(args, "-repeats", NUM_REPEATS))
+
+    with tempfile.TemporaryDirectory() as sock_dir:
+        path = os.path.join(sock_dir, "server.sock")
+        port = free_port()
+        # Rate limiting is disabled, as both measures exceed its rates.
+        server = start_server(port, [f"-unix-socket={path}",
+                                     "-origin-rate=0", "-dest-rate=0"])
+        try:
+            transports = [
+                ("tcp", (socket.AF_INET, ("127.0.0.1", port))),
+                ("unix", (socket.AF_UNIX, path)),
+            ]
+            # best is map transport -> [round trip time, messages per second]
+            best = {name: [float("inf"), 0.0] for name, _ in transports}
+            for _ in range(num_repeats):
+                for name, addr in transports:
+                    elapsed = round_trips(addr, num_round_trips)
+                    msgs_per_s = throughput(addr, num_msgs)
+                    best[name][0] = min(best[name][0], elapsed)
+                    best[name][1] = max(best[name][1], msgs_per_s)
+        finally:
+            stop_server(server)
+
+    rows = []
+    for name, (elapsed, msgs_per_s) in best.items():
+        rows.append([name, f"{elapsed / num_round_trips * 1e6:.1f}",
+                     f"{msgs_per_s:.0f}"])
+
+    print(f"{num_round_trips} REQ_INF/RES_INF round trips and {num_msgs} "+
+          f"REQ_INF through the server, best of {num_repeats}")
+    print_table(["transport", "us_per_round_trip", "req_inf_per_s"], rows)
+
+def connect(addr):
+    family, address = addr
+    sock = new_socket(family)
+    sock.connect(address)
+    return sock
+
+def join(sock):
+    send_msg(sock, ReqAdd())
+    equipid = recv_msg(sock).equipid()
+    recv_msg(sock) # RES_LIST
+    return equipid
+
+def leave(sock, equipid):
+    send_msg(sock, ReqRem(originid=equipid))
+    # Membership announcements may still precede the answer to the removal.
+    while recv_msg(sock).msgid != Ok.MSGID:
+        pass
+    sock.close()
+
+def round_trips(addr, num_round_trips):
+    sock_a = connect(addr)
+    equipid_a = join(sock_a)
+    sock_b = connect(addr)
+    equipid_b = join(sock_b)
+
+    start = time.perf_counter()
+    for _ in range(num_round_trips):
+        send_msg(sock_a, ReqInf(originid=equipid_a, destid=equipid_b))
+        recv_msg(sock_b)
+        send_msg(sock_b, ResInf(originid=equipid_b, destid=equipid_a,
+                                payload="1.0"))
+        msg = recv_msg(sock_a)
+        while msg.msgid != ResInf.MSGID:
+            msg = recv_msg(sock_a)
+    elapsed = time.perf_counter() - start
+
+    leave(sock_b, equipid_b)
+    leave(sock_a, equipid_a)
+    return elapsed
+
+def throughput(addr, num_msgs):
+    sock = connect(addr)
+    equipid = join(sock)
+
+    # The sender runs in its own process, so it does not compete with the
+    # receiver for the interpreter lock.
+    sender = multiprocessing.Process(target=send_all,
+                                     args=(addr, equipid, num_msgs),
+                                     daemon=True)
+    sender.start()
+
+    # Time is taken from the first REQ_INF received, after the sender joined.
+    num_received = 0
+    start = None
+    while num_received < num_msgs:
+        msg = recv_msg(sock)
+        if msg.msgid != ReqInf.MSGID:
+            continue
+        if start == None:
+            start = time.perf_counter()
+        num_received += 1
+    elapsed = time.perf_counter() - start
+
+    sender.join()
+    leave(sock, equipid)
+    return (num_msgs - 1) / elapsed
+
+def send_all(addr, destid, num_msgs):
+    sock = connect(addr)
+    equipid = join(sock)
+    msg = ReqInf(originid=equipid, destid=destid)
+    for _ in range(num_msgs):
+        send_msg(sock, msg)
+    leave(sock, equipid)
@@ -0,0 +1,57 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+MIN_DURATION = 0.2 # Seconds
+SERVER_START_TIMEOUT = 5 # Seconds
+
+SERVER_MAIN = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                           "server_main.py")
+
+def time_per_call(fn, min_duration=MIN_DURATION):
+    # Calls fn in growing batches until a batch lasts min_duration.
+    num_calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(num_calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_duration:
+            return elapsed / num_calls
+        num_calls *= 2
+
+def print_table(header, rows):
+    widths = [max(len(str(row[i])) for row in [header] + rows)
+              for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(str(col).rjust(width)
+                        for col, width in zip(row, widths)))
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def start_server(port, args=[]):
+    # The server runs in its own process, as in production, and its output is
+    # discarded.
+    proc = subprocess.Popen([sys.executable, SERVER_MAIN, str(port)] + args,
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return proc
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"Server did not start listening on port {port}")
+
+def stop_server(proc):
+    proc.kill()
+    proc.wait()
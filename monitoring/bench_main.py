@@ -0,0 +1,4 @@
+from bench.main import main as bench_main
+
+if __name__ == '__main__':
+    bench_main()
@@ -1,4 +1,3 @@
-import random
 import socket
 import select
 import sys
@@ -7,8 +6,9 @@ import threading
 from common.comm import (new_socket,
                          send_msg,
                          recv_msg,
-                         MAX_MSG_SIZE)
-from common import log
+                         has_pending,
+                         COMPRESSION_ZLIB)
+from common import log, tls
 from common.message import (MESSAGE_BUILDERS,
                             EQID_LEN,
                             decode as decode_msg,
@@ -22,8 +22,10 @@ from common.message import (MESSAGE_BUILDERS,
                             Error,
                             Ok,
 )
+from common.code import CODE_EQUIPMENT_NOT_FOUND
 from .defs import LOGGER_NAME
 from .command import Command
+from .readings import random_readings
 
 logger = log.logger(LOGGER_NAME)
 
@@ -37,18 +39,39 @@ class Client:
 
     _SELECT_TIMEOUT = 0.01 # Seconds
 
-    def __init__(self, config):
+    def __init__(self, config, readings=None, tls_context=None, sessions=None,
+                 output=print):
         self._server_addr = config.server_addr
         self._server_port = config.server_port
+        self._unix_socket = config.unix_socket
+        self._compression = config.compression
+
+        # Sessions are only resumed by sockets of the context that created
+        # them, so clients sharing sessions must share the context too.
+        if tls_context == None and config.tls_ca != None:
+            tls_context = tls.client_context(config.tls_ca)
+        self._tls_context = tls_context
+        self._sessions = sessions
 
         self._sock = None
         # _listener is the thread that listens for messages from the server.
         self._equipid = None
         self._other_equipids = []
 
+        # _readings generates the values answered to information requests.
+        if readings == None:
+            readings = random_readings()
+        self._readings = readings
+
+        # _output shows the events of the equipment to the user.
+        self._output = output
+
     def init(self):
         self._connect()
         self._register_equipment()
+        if self._tls_context != None and self._sessions != None:
+            self._sessions.store(self._server_addr, self._server_port,
+                                 self._sock)
 
     def run(self):
         try:
@@ -60,6 +83,8 @@ class Client:
                                          self._SELECT_TIMEOUT)
                 if incoming[0]:
                     self._process_incoming()
+                    while self.has_pending():
+                        self._process_incoming()
 
                 command_exists = select.select([sys.stdin], [], [],
                                                self._SELECT_TIMEOUT)
@@ -67,9 +92,10 @@ class Client:
                     continue
                 else:
                     command_str = sys.stdin.readline()
-                    logger.debug("Received command {}".format(command_str))
-                    command = self._parse_command(command_str)
-                    done = self._process_command(command)
+                    if command_str == "":
+                        logger.info("Reached end of input")
+                        break
+                    done = self.execute(command_str)
                     if done:
                         break
 
@@ -81,6 +107,29 @@ class Client:
             except Exception as e:
                 logger.error("Error closing socket: {}".format(e))
 
+    def execute(self, command_str):
+        logger.debug("Received command {}".format(command_str))
+        command = self._parse_command(command_str)
+        return self._process_command(command)
+
+    def service(self):
+        self._process_incoming()
+
+    def has_pending(self):
+        return has_pending(self._sock)
+
+    def equipid(self):
+        return self._equipid
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def close_socket(self):
+        try:
+            self._sock.close()
+        except Exception as e:
+            logger.error("Error closing socket: {}".format(e))
+
     def _parse_command(self, command_str):
         command_str = command_str.strip()
         if command_str.startswith(self.CLOSE_CONNECTION):
@@ -117,55 +166,61 @@ class Client:
         logger.debug("Processing incoming message from server")
 
         msg = self._recv()
+        self._process_msg(msg)
+
+    def _process_msg(self, msg):
         if msg.MSGID == ReqRem.MSGID:
-            removed_equipid = msg.originid
-            self._other_equipids.remove(removed_equipid)
-            logger.debug("Removed equipment id {}".format(removed_equipid))
-            print("Equipment {} removed".format(removed_equipid))
+            for removed_equipid in msg.equipids():
+                self._other_equipids.remove(removed_equipid)
+                logger.debug("Removed equipment id {}".format(removed_equipid))
+                self._output("Equipment {} removed".format(removed_equipid))
         elif msg.MSGID == ResAdd.MSGID:
-            new_equipid = msg.equipid()
-            self._other_equipids.append(new_equipid)
-            logger.debug("Added equipment id {}".format(new_equipid))
-            print("Equipment {} added".format(new_equipid))
+            for new_equipid in msg.equipids():
+                self._other_equipids.append(new_equipid)
+                logger.debug("Added equipment id {}".format(new_equipid))
+                self._output("Equipment {} added".format(new_equipid))
         elif msg.MSGID == ResList.MSGID:
             self._other_equipids = msg.equipments()
             logger.debug("New list of equipment ids: {}".format(
                 self._other_equipids))
         elif msg.MSGID == ReqInf.MSGID:
-            print("requested information")
-            info = str(round(random.random() * 10, 2))
+            self._output("requested information")
+            info = str(next(self._readings))
             resp = ResInf(originid=self._equipid,
                           destid=msg.originid,
                           payload=info)
             self._send(resp)
         elif msg.msgid == ResInf.MSGID:
-            print("Value from {}: {}".format(msg.originid,
+            self._output("Value from {}: {}".format(msg.originid,
                                              msg.value()))
         elif msg.MSGID == Error.MSGID:
-            print(msg.error())
+            self._output(msg.error())
         elif msg.msgid == Ok.MSGID:            
-            print(msg.description())
+            self._output(msg.description())
 
     def _register_equipment(self):
         logger.debug("Registering equipment")
 
         req_builder = MESSAGE_BUILDERS["01"]
-        msg = req_builder()
+        codecs = None
+        if self._compression == COMPRESSION_ZLIB:
+            codecs = COMPRESSION_ZLIB
+        msg = req_builder(payload=codecs)
         self._send(msg)
 
         # Expect to receive message with my ID in the network
         msg = self._recv()
         if msg.msgid == Error.MSGID:
-            print(msg.error())
+            self._output(msg.error())
         elif msg.msgid == ResAdd.MSGID:
             self._equipid = msg.payload
-            print("New ID: {}".format(self._equipid))
+            self._output("New ID: {}".format(self._equipid))
 
             msg = self._recv()
             self._other_equipids = msg.equipments()
 
     def _list_equipment(self):
-        print(" ".join(self._other_equipids))
+        self._output(" ".join(self._other_equipids))
 
     def _request_information(self, destid):
         msg = ReqInf(originid=self._equipid, destid=destid)
@@ -178,9 +233,19 @@ class Client:
         return recv_msg(self._sock)
 
     def _connect(self):
-        logger.info(f"Connecting client to {self._server_addr}:{self._server_port}")
-        self._sock = new_socket()
-        self._sock.connect((self._server_addr, self._server_port))
+        if self._unix_socket != None:
+            logger.info(f"Connecting client to {self._unix_socket}")
+            self._sock = new_socket(socket.AF_UNIX)
+            self._sock.connect(self._unix_socket)
+        else:
+            logger.info(f"Connecting client to {self._server_addr}:"+
+                        f"{self._server_port}")
+            self._sock = new_socket()
+            self._sock.connect((self._server_addr, self._server_port))
+        if self._tls_context != None:
+            self._sock = tls.wrap_client(self._tls_context, self._sock,
+                                         self._server_addr, self._server_port,
+                                         self._sessions)
         logger.info(f"Established connection to {self._server_addr}:"+
                     f"{self._server_port}")
 
@@ -191,10 +256,23 @@ class Client:
         remove_equip_msg = req_builder(originid=self._equipid)
         self._send(remove_equip_msg)
 
+        # Messages already on their way are processed until the server
+        # answers the removal.
         msg = self._recv()
+        while not self._answers_removal(msg):
+            self._process_msg(msg)
+            msg = self._recv()
         if msg.msgid == Error.MSGID:
-            print(msg.error())
+            self._output(msg.error())
         else:
-            print("Successful removal")
+            self._output("Successful removal")
 
         self._sock.close()
+
+    def _answers_removal(self, msg):
+        # Errors about earlier requests, such as throttled ones, may arrive
+        # before the answer to the removal.
+        if msg.msgid == Ok.MSGID:
+            return True
+        return (msg.msgid == Error.MSGID and msg.destid == None and
+                msg.payload == CODE_EQUIPMENT_NOT_FOUND.id)
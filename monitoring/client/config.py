@@ -1,9 +1,33 @@
 from common import log
+from common.comm import COMPRESSION_ZLIB, COMPRESSIONS
+from common.utils import get_option, get_choice_option, get_switch_option
 
 class Config:
-    def __init__(self, server_addr, server_port):
+    def __init__(self, server_addr, server_port, script=None,
+                 num_equipments=1, seed=None, capture=None,
+                 compression=COMPRESSION_ZLIB, tls_ca=None, unix_socket=None,
+                 equipment_output=False):
         self.server_addr = server_addr
         self.server_port = server_port
+        # unix_socket is the path of the server's Unix socket. When set, the
+        # client connects to it instead of server_addr and server_port.
+        self.unix_socket = unix_socket
+        # equipment_output shows what each virtual equipment would print in
+        # headless mode. It is off so large fleets do not flood the output.
+        self.equipment_output = equipment_output
+        # script is the path of a command script run in headless mode.
+        self.script = script
+        self.num_equipments = num_equipments
+        self.seed = seed
+        # capture is the path of the file where traffic is recorded.
+        self.capture = capture
+        self.compression = compression
+        # tls_ca is the certificate used to verify the server. The client
+        # connects over TLS when it is set.
+        self.tls_ca = tls_ca
+
+    def headless(self):
+        return self.script != None or self.num_equipments > 1
 
 def parse_config(args):
     min_args = 2
@@ -13,4 +37,21 @@ def parse_config(args):
     server_addr = args[0]
     server_port = int(args[1])
 
-    return Config(server_addr, server_port)
+    script = get_option(args, "-script")
+    num_equipments = int(get_option(args, "-equipments", 1))
+    if num_equipments < 1:
+        raise ValueError(f"Need at least one equipment. Got {num_equipments}")
+    seed = get_option(args, "-seed")
+    if seed != None:
+        seed = int(seed)
+    capture = get_option(args, "-capture")
+    compression = get_choice_option(args, "-compression", COMPRESSIONS,
+                                    COMPRESSION_ZLIB)
+    tls_ca = get_option(args, "-tls-ca")
+    unix_socket = get_option(args, "-unix-socket")
+    equipment_output = get_switch_option(args, "-equipment-output", False)
+
+    return Config(server_addr, server_port, script=script,
+                  num_equipments=num_equipments, seed=seed, capture=capture,
+                  compression=compression, tls_ca=tls_ca,
+                  unix_socket=unix_socket, equipment_output=equipment_output)
@@ -1,12 +1,15 @@
 import sys
 
-from common import log
+from common import comm, log
+from common.capture import Capture, ROLE_CLIENT
 from .client import Client
 from .config import parse_config
+from .simulator import Simulator
 
 logger = log.logger('industry50-client')
 
 def main():
+    capture = None
     try:
         log.parse_config_log_level(sys.argv[1:])
 
@@ -15,7 +18,15 @@ def main():
         logger.info(f"Program got arguments: {sys.argv[1:]}")
 
         config = parse_config(sys.argv[1:])
-        client = Client(config)
+        if config.capture != None:
+            logger.info(f"Capturing traffic to '{config.capture}'")
+            capture = Capture(config.capture, ROLE_CLIENT)
+            comm.set_capture(capture)
+
+        if config.headless():
+            client = Simulator(config)
+        else:
+            client = Client(config)
         client.init()
         client.run()
 
@@ -23,3 +34,7 @@ def main():
 
     except Exception as e:
         logger.critical(f"Encountered fatal error: {e}", exc_info=True)
+    finally:
+        if capture != None:
+            comm.set_capture(None)
+            capture.close()
@@ -0,0 +1,5 @@
+import random
+
+def random_readings(rng=random):
+    while True:
+        yield round(rng.random() * 10, 2)
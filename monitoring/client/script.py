@@ -0,0 +1,46 @@
+import json
+
+# A script has one step per line. A step is either a plain command, issued by
+# the first equipment, or a JSON object such as
+#
+#   {"equipment": 3, "command": "request information from 01", "delay": 0.5}
+#
+# where "delay" is the number of seconds to wait after the previous step.
+# Empty lines and lines starting with '#' are ignored.
+EQUIPMENT_KEY = "equipment"
+COMMAND_KEY = "command"
+DELAY_KEY = "delay"
+
+COMMENT_PREFIX = "#"
+
+class Step:
+    def __init__(self, equipment, command, delay=0.0):
+        self.equipment = equipment
+        self.command = command
+        self.delay = delay
+
+def parse_step(line):
+    line = line.strip()
+    if line == "" or line.startswith(COMMENT_PREFIX):
+        return None
+
+    if not line.startswith("{"):
+        return Step(0, line)
+
+    try:
+        obj = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid script step '{line}': {e}")
+    if COMMAND_KEY not in obj:
+        raise ValueError(f"Script step '{line}' has no '{COMMAND_KEY}' key")
+
+    return Step(int(obj.get(EQUIPMENT_KEY, 0)),
+                obj[COMMAND_KEY],
+                float(obj.get(DELAY_KEY, 0.0)))
+
+def read_script(path):
+    with open(path) as f:
+        for line in f:
+            step = parse_step(line)
+            if step != None:
+                yield step
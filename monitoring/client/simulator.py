@@ -0,0 +1,169 @@
+import random
+import selectors
+import time
+
+from common import log, tls
+from .client import Client
+from .defs import LOGGER_NAME
+from .readings import random_readings
+from .script import read_script
+
+logger = log.logger(LOGGER_NAME)
+
+# Simulator hosts several virtual equipments over a single event loop. Each
+# equipment is a regular Client with its own connection and reading generator.
+# Commands come from a script instead of the standard input. Without a script,
+# the simulator serves the server until interrupted.
+class Simulator:
+    _SELECT_TIMEOUT = 0.01 # Seconds
+    _DRAIN_TIMEOUT = 0.1 # Seconds
+
+    def __init__(self, config):
+        self._config = config
+
+        self._selector = selectors.DefaultSelector()
+        # _equipments is list index -> Client. Finished equipments are None.
+        self._equipments = []
+
+        # Equipments share TLS sessions, so only the first one runs a full
+        # handshake.
+        self._tls_context = None
+        if config.tls_ca != None:
+            self._tls_context = tls.client_context(config.tls_ca)
+        self._sessions = tls.SessionCache()
+
+        # _num_outputs counts the lines the equipments did not print.
+        self._num_outputs = 0
+
+    def init(self):
+        logger.info(f"Starting {self._config.num_equipments} virtual equipments")
+
+        for index in range(self._config.num_equipments):
+            equipment = Client(self._config,
+                               readings=random_readings(self._rng(index)),
+                               tls_context=self._tls_context,
+                               sessions=self._sessions,
+                               output=self._output_of(index))
+            equipment.init()
+            if equipment.equipid() == None:
+                logger.error(f"Virtual equipment {index} failed to register")
+                equipment.close_socket()
+                self._equipments.append(None)
+                continue
+
+            self._selector.register(equipment, selectors.EVENT_READ, index)
+            self._equipments.append(equipment)
+
+    def run(self):
+        logger.info("Running industry 5.0 simulator")
+
+        steps = None
+        if self._config.script != None:
+            steps = read_script(self._config.script)
+
+        try:
+            step, step_due = self._next_step(steps, time.monotonic())
+            while self._num_active() > 0:
+                self._service(self._SELECT_TIMEOUT)
+
+                while step != None and time.monotonic() >= step_due:
+                    self._execute(step)
+                    step, step_due = self._next_step(steps, step_due)
+
+                if steps != None and step == None:
+                    logger.info("Reached end of script")
+                    self._drain()
+                    break
+        except KeyboardInterrupt:
+            logger.info("Simulator interrupted")
+        finally:
+            self._close_all()
+            if not self._config.equipment_output:
+                logger.info(f"Virtual equipments output {self._num_outputs} "+
+                            f"lines, not shown")
+
+    def _output_of(self, index):
+        def output(line):
+            if self._config.equipment_output:
+                print("[{}] {}".format(index, line))
+            else:
+                self._num_outputs += 1
+        return output
+
+    def _rng(self, index):
+        if self._config.seed == None:
+            return random.Random()
+        return random.Random(self._config.seed + index)
+
+    def _next_step(self, steps, last_due):
+        if steps == None:
+            return None, None
+        step = next(steps, None)
+        if step == None:
+            return None, None
+        return step, last_due + step.delay
+
+    def _drain(self):
+        # Serve replies to the last steps until the connections go quiet.
+        while self._num_active() > 0 and self._service(self._DRAIN_TIMEOUT):
+            pass
+
+    def _service(self, timeout):
+        events = self._selector.select(timeout)
+        for key, _ in events:
+            self._service_equipment(key.data)
+        # Data already decrypted by TLS sockets is not reported by select.
+        for index, equipment in enumerate(self._equipments):
+            while equipment != None and equipment.has_pending():
+                self._service_equipment(index)
+                equipment = self._equipments[index]
+        return len(events) > 0
+
+    def _service_equipment(self, index):
+        try:
+            self._equipments[index].service()
+        except Exception as e:
+            logger.error(f"Virtual equipment {index} failed: {e}",
+                         exc_info=True)
+            self._drop(index)
+
+    def _execute(self, step):
+        if step.equipment < 0 or step.equipment >= len(self._equipments):
+            logger.error(f"Script step for unknown equipment {step.equipment}")
+            return
+        equipment = self._equipments[step.equipment]
+        if equipment == None:
+            logger.warning(f"Script step for finished equipment {step.equipment}")
+            return
+
+        try:
+            done = equipment.execute(step.command)
+        except Exception as e:
+            logger.error(f"Virtual equipment {step.equipment} failed to run "+
+                         f"command '{step.command}': {e}")
+            return
+        if done:
+            self._drop(step.equipment)
+
+    def _drop(self, index):
+        equipment = self._equipments[index]
+        self._equipments[index] = None
+        try:
+            self._selector.unregister(equipment)
+        except (KeyError, ValueError):
+            pass
+        equipment.close_socket()
+
+    def _close_all(self):
+        for index, equipment in enumerate(self._equipments):
+            if equipment == None:
+                continue
+            try:
+                equipment.execute(Client.CLOSE_CONNECTION)
+            except Exception as e:
+                logger.error(f"Error closing virtual equipment {index}: {e}")
+            self._drop(index)
+        self._selector.close()
+
+    def _num_active(self):
+        return sum(1 for e in self._equipments if e != None)
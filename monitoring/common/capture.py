@@ -0,0 +1,193 @@
+import collections
+import struct
+import threading
+import time
+import weakref
+
+from . import log
+
+logger = log.logger('common-logger')
+
+# A capture file starts with a header (magic, role, wall-clock start time)
+# followed by one record per frame. A record is a fixed header (nanoseconds
+# since the start of the capture, direction, peer length, frame length), the
+# peer and the raw frame bytes.
+CAPTURE_MAGIC = b"I50CAP\x01"
+FILE_HEADER = struct.Struct("<7scd")
+RECORD_HEADER = struct.Struct("<QBBI")
+
+ROLE_SERVER = b"S"
+ROLE_CLIENT = b"C"
+
+DIRECTION_IN = 0
+DIRECTION_OUT = 1
+
+class Frame:
+    def __init__(self, timestamp, direction, peer, data):
+        # timestamp is given in seconds since the start of the capture.
+        self.timestamp = timestamp
+        self.direction = direction
+        self.peer = peer
+        self.data = data
+
+# Capture records frames into preallocated buffers. A background thread writes
+# the full buffers to the capture file, so the I/O path only copies the frame.
+class Capture:
+    BUFFER_SIZE = 1 << 20 # Bytes
+    NUM_BUFFERS = 2
+    FLUSH_INTERVAL = 0.1 # Seconds
+
+    def __init__(self, path, role, buffer_size=BUFFER_SIZE):
+        self._role = role
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(CAPTURE_MAGIC, role, time.time()))
+        self._start_ns = time.monotonic_ns()
+
+        # _cond guards the buffers, _chunks and _peers.
+        self._cond = threading.Condition()
+        self._spare = [bytearray(buffer_size) for _ in range(self.NUM_BUFFERS-1)]
+        self._buffer = bytearray(buffer_size)
+        self._used = 0
+        # _chunks holds, in order, the data waiting to be written. It has
+        # (buffer, used) pairs and oversized records.
+        self._chunks = collections.deque()
+        # _peers caches the peer name of each socket.
+        self._peers = weakref.WeakKeyDictionary()
+        # _num_unnamed numbers the sockets without an address, such as Unix
+        # sockets, as their fd numbers are reused.
+        self._num_unnamed = 0
+        self._closing = False
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def record(self, direction, sock, data):
+        timestamp = time.monotonic_ns() - self._start_ns
+        with self._cond:
+            if self._closing:
+                return
+
+            peer = self._peer(sock)
+            size = RECORD_HEADER.size + len(peer) + len(data)
+            if self._used + size > len(self._buffer):
+                self._swap_buffer()
+
+            if size > len(self._buffer):
+                self._chunks.append(RECORD_HEADER.pack(timestamp, direction,
+                                                       len(peer), len(data))
+                                    + peer + data)
+                self._cond.notify_all()
+                return
+
+            pos = self._used
+            RECORD_HEADER.pack_into(self._buffer, pos, timestamp, direction,
+                                    len(peer), len(data))
+            pos += RECORD_HEADER.size
+            self._buffer[pos:pos+len(peer)] = peer
+            pos += len(peer)
+            self._buffer[pos:pos+len(data)] = data
+            self._used = pos + len(data)
+
+    def close(self):
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            if self._used > 0:
+                self._chunks.append((self._buffer, self._used))
+                self._used = 0
+            self._cond.notify_all()
+
+        self._writer.join()
+        self._file.close()
+
+    def _peer(self, sock):
+        peer = self._peers.get(sock)
+        if peer != None:
+            return peer
+
+        # The peer is always the client endpoint of the connection, so that
+        # it identifies the connection from both sides.
+        try:
+            if self._role == ROLE_SERVER:
+                addr = sock.getpeername()
+            else:
+                addr = sock.getsockname()
+            if isinstance(addr, tuple):
+                addr = "{}:{}".format(addr[0], addr[1])
+        except OSError:
+            addr = ""
+        if not addr:
+            self._num_unnamed += 1
+            addr = "conn{}".format(self._num_unnamed)
+        peer = addr.encode('utf-8')[:255]
+
+        self._peers[sock] = peer
+        return peer
+
+    def _swap_buffer(self):
+        if self._used > 0:
+            self._chunks.append((self._buffer, self._used))
+            self._cond.notify_all()
+        while len(self._spare) == 0:
+            self._cond.wait()
+        self._buffer = self._spare.pop()
+        self._used = 0
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                if len(self._chunks) == 0 and not self._closing:
+                    self._cond.wait(self.FLUSH_INTERVAL)
+                # Flush partially filled buffers when the capture is idle.
+                if (len(self._chunks) == 0 and self._used > 0 and
+                    len(self._spare) > 0):
+                    self._swap_buffer()
+                chunks = list(self._chunks)
+                self._chunks.clear()
+                done = self._closing and len(chunks) == 0
+
+            if done:
+                break
+
+            try:
+                for chunk in chunks:
+                    if isinstance(chunk, tuple):
+                        buffer, used = chunk
+                        self._file.write(memoryview(buffer)[:used])
+                    else:
+                        self._file.write(chunk)
+                self._file.flush()
+            except Exception as e:
+                logger.error(f"Error writing capture: {e}")
+            finally:
+                with self._cond:
+                    for chunk in chunks:
+                        if isinstance(chunk, tuple):
+                            self._spare.append(chunk[0])
+                    self._cond.notify_all()
+
+def read_capture(path):
+    with open(path, "rb") as f:
+        header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            raise ValueError(f"Capture file '{path}' is too short")
+        magic, role, start_time = FILE_HEADER.unpack(header)
+        if magic != CAPTURE_MAGIC:
+            raise ValueError(f"'{path}' is not a capture file")
+
+        frames = []
+        while True:
+            record_header = f.read(RECORD_HEADER.size)
+            if len(record_header) < RECORD_HEADER.size:
+                break
+            timestamp, direction, peer_len, data_len = RECORD_HEADER.unpack(
+                record_header)
+            peer = f.read(peer_len).decode('utf-8')
+            data = f.read(data_len)
+            if len(data) < data_len:
+                logger.warning(f"Capture file '{path}' has a truncated record")
+                break
+            frames.append(Frame(timestamp / 1e9, direction, peer, data))
+
+    return role, frames
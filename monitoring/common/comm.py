@@ -1,37 +1,143 @@
+import os
 import socket
+import ssl
+import stat
+import struct
+import zlib
 
+from .capture import DIRECTION_IN, DIRECTION_OUT
+from .errors import InvalidMessageError
 from .message import (Message,
                       decode as decode_msg,
-                      MESSAGE_DELIMITER,
 )
 
 from . import log
 
 logger = log.logger('common-logger')
 
-MAX_MSG_SIZE = 1024
+# A frame is a header (body length, flags) followed by the body, which is an
+# encoded message, possibly compressed.
+FRAME_HEADER = struct.Struct("!IB")
+# MAX_FRAME_SIZE is well above the largest message of the protocol, a
+# RES_LIST of every equipment, before and after decompression.
+MAX_FRAME_SIZE = 64 * 1024 # Bytes
+# RECV_CHUNK is the most read at once for a frame.
+RECV_CHUNK = 4096 # Bytes
 
-def new_socket():
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+FLAG_ZLIB = 0x01
+
+# COMPRESSION_ZLIB is advertised by clients that accept compressed frames.
+COMPRESSION_ZLIB = "zlib"
+COMPRESSION_NONE = "none"
+COMPRESSIONS = [COMPRESSION_ZLIB, COMPRESSION_NONE]
+# Bodies smaller than COMPRESSION_THRESHOLD bytes are never compressed.
+COMPRESSION_THRESHOLD = 256
+COMPRESSION_LEVEL = 1
+
+# _capture records the frames sent and received by this process, if set.
+_capture = None
+
+def set_capture(capture):
+    global _capture
+    _capture = capture
+
+def new_socket(family=socket.AF_INET):
+    sock = socket.socket(family, socket.SOCK_STREAM)
 #    sock.setblocking(False)
+    if family != socket.AF_UNIX:
+        # Frames are small and sent as soon as they are ready. Accepted
+        # sockets inherit the option from the listening socket.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     return sock
 
-def send_msg(sock, msg):
+# remove_stale_socket removes the Unix socket left at path by a previous
+# process, so the path can be bound again. Sockets still accepting
+# connections and other files are left alone.
+def remove_stale_socket(path):
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            return
+    except FileNotFoundError:
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+    finally:
+        probe.close()
+
+def has_pending(sock):
+    # TLS sockets may hold decrypted data that select does not report.
+    return isinstance(sock, ssl.SSLSocket) and sock.pending() > 0
+
+def send_msg(sock, msg, compress=False):
     logger.debug("Sending message {} to socket {}".format(msg, sock))
-    encoded_msg = msg.encode()
-    sock.send(encoded_msg)
+    send_frame(sock, encode_frame(msg.encode(), compress))
     logger.debug("Message sent")
 
+def send_frame(sock, frame):
+    sock.sendall(frame)
+    if _capture != None:
+        _capture.record(DIRECTION_OUT, sock, frame)
+
 def recv_msg(sock):
     logger.debug("Receiving message from socket {}".format(sock))
-    
-    num_bytes = 0
-    msg_str = ""
-    last_char = ""
-    while last_char != MESSAGE_DELIMITER and num_bytes < MAX_MSG_SIZE:
-        msg_byte = sock.recv(1)
-        last_char = msg_byte.decode('ascii')
-        msg_str += last_char
-
-    msg = decode_msg(msg_str)
+
+    msg = decode_msg(recv_body(sock))
     return msg
+
+def recv_body(sock):
+    return decode_frame(recv_frame(sock))
+
+def recv_frame(sock):
+    header = _recv_exact(sock, FRAME_HEADER.size)
+    length, _ = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise InvalidMessageError(f"frame of {length} bytes exceeds "+
+                                  f"{MAX_FRAME_SIZE} bytes")
+
+    frame = header + _recv_exact(sock, length)
+    if _capture != None:
+        _capture.record(DIRECTION_IN, sock, frame)
+    return frame
+
+def encode_frame(body, compress=False, level=COMPRESSION_LEVEL):
+    flags = 0
+    if compress and len(body) >= COMPRESSION_THRESHOLD:
+        compressed = zlib.compress(body, level)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_ZLIB
+    if len(body) > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame body of {len(body)} bytes exceeds "+
+                         f"{MAX_FRAME_SIZE} bytes")
+    return FRAME_HEADER.pack(len(body), flags) + body
+
+def decode_frame(frame):
+    # The body is a view of the frame, so it is never copied unless it has to
+    # be decompressed.
+    _, flags = FRAME_HEADER.unpack_from(frame)
+    body = memoryview(frame)[FRAME_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        try:
+            decompressor = zlib.decompressobj()
+            body = decompressor.decompress(body, MAX_FRAME_SIZE)
+        except zlib.error as e:
+            raise InvalidMessageError(f"corrupt compressed frame: {e}")
+        if decompressor.unconsumed_tail:
+            raise InvalidMessageError(f"decompressed frame exceeds "+
+                                      f"{MAX_FRAME_SIZE} bytes")
+    return body
+
+def _recv_exact(sock, size):
+    # The buffer grows as data arrives, so a peer only makes it as large as
+    # what it actually sent, not as the length it claims.
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(min(size - len(buf), RECV_CHUNK))
+        if len(chunk) == 0:
+            raise ConnectionResetError("Connection closed by peer")
+        buf += chunk
+    return bytes(buf)
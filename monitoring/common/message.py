@@ -1,4 +1,5 @@
 import json
+import struct
 
 from .errors import InvalidMessageError
 from .code import (CODE_EQUIPMENT_NOT_FOUND,
@@ -12,7 +13,18 @@ from common import log
 logger = log.logger("industry50-common")
 
 EQID_LEN = 2
-MESSAGE_DELIMITER = "\n"
+
+# Missing fields are encoded as a single MISSING byte.
+MISSING = b"-"
+MISSING_BYTE = MISSING[0]
+
+# ID_HEADER is the msgid, originid and destid of a message with both ids.
+ID_HEADER = struct.Struct(f"{EQID_LEN}s{EQID_LEN}s{EQID_LEN}s")
+
+# Control messages change the membership of the network or report errors. They
+# are sent ahead of data messages.
+PRIORITY_CONTROL = 0
+PRIORITY_DATA = 1
 
 class Message:
     MSGNAME_KEY = "type"
@@ -21,6 +33,8 @@ class Message:
     DESTID_KEY = "destid"
     PAYLOAD_KEY = "payload"
 
+    PRIORITY = PRIORITY_CONTROL
+
     def __init__(self, msgname, msgid, originid=None,
                  destid=None, payload=None):
         self.msgname = msgname
@@ -30,28 +44,28 @@ class Message:
         self.payload = payload
 
     def encode(self):
-        m = "{}".format(self.msgid)
-        if self.originid == None:
-            m += "-"
-        else:
-            m += str(self.originid)
-        if self.destid == None:
-            m += "-"
-        else:
-            m += str(self.destid)
-        if self.payload == None or self.payload == "":
-            m += "-"
-        else:
-            m += str(self.payload)
-        m += "\n"
-        return m.encode('ascii')
+        return b"".join([_encode_field(self.msgid),
+                         _encode_field(self.originid),
+                         _encode_field(self.destid),
+                         _encode_field(self.payload)])
+
+def _encode_field(value):
+    if value == None or value == "":
+        return MISSING
+    return str(value).encode('ascii')
 
 class ReqAdd(Message):
     MSG_NAME = "REQ_ADD"
     MSGID = "01"
     def __init__(self, originid=None, destid=None, payload=None):
-        logger.debug("Constructing message of type req add")
-        super().__init__(self.MSG_NAME, self.MSGID)
+        logger.debug("Constructing message of type req add. Payload: {}".format(
+            payload))
+        super().__init__(self.MSG_NAME, self.MSGID, payload=payload)
+
+    def codecs(self):
+        if self.payload == None:
+            return []
+        return self.payload.split(" ")
 
 class ReqRem(Message):
     MSG_NAME = "REQ_REM"
@@ -59,7 +73,15 @@ class ReqRem(Message):
     def __init__(self, originid=None, destid=None, payload=None):
         logger.debug("Constructing message of type req rem. Originid: {}".format(
             originid))
-        super().__init__(self.MSG_NAME, self.MSGID, originid=originid)
+        super().__init__(self.MSG_NAME, self.MSGID, originid=originid,
+                         payload=payload)
+
+    # The server announces several removals at once with the ids in the
+    # payload instead of the origin.
+    def equipids(self):
+        if self.payload == None:
+            return [self.originid]
+        return self.payload.split(" ")
 
 class ResAdd(Message):
     MSG_NAME = "RES_ADD"
@@ -72,6 +94,10 @@ class ResAdd(Message):
     def equipid(self):
         return self.payload
 
+    # The server announces several additions at once, separated by spaces.
+    def equipids(self):
+        return self.payload.split(" ")
+
 class ResList(Message):
     MSG_NAME = "RES_LIST"
     MSGID = "04"
@@ -88,6 +114,7 @@ class ResList(Message):
 class ReqInf(Message):
     MSG_NAME = "REQ_INF"
     MSGID = "05"
+    PRIORITY = PRIORITY_DATA
     def __init__(self, originid=None, destid=None, payload=None):
         logger.debug("Constructing message of type req inf. originid={} destid={}".
                      format(originid, destid))
@@ -96,6 +123,7 @@ class ReqInf(Message):
 class ResInf(Message):
     MSG_NAME = "RES_INF"
     MSGID = "06"
+    PRIORITY = PRIORITY_DATA
     def __init__(self, originid=None, destid=None, payload=None):
         logger.debug(f"Constructing message of type res inf. originid={originid} "+
                      f"destid={destid} payload={payload}")
@@ -105,6 +133,28 @@ class ResInf(Message):
     def value(self):
         return self.payload
 
+# RoutedMsg is a REQ_INF or RES_INF kept as received. The server forwards it
+# on the ids in its header, without decoding nor encoding it. The ids are
+# bytes.
+class RoutedMsg:
+    PRIORITY = PRIORITY_DATA
+
+    def __init__(self, msgid, originid, destid, body):
+        self.msgid = msgid
+        self.originid = originid
+        self.destid = destid
+        self.body = body
+
+    @staticmethod
+    def from_msg(msg):
+        return RoutedMsg(msg.msgid.encode('ascii'), _encode_id(msg.originid),
+                         _encode_id(msg.destid), msg.encode())
+
+def _encode_id(equipid):
+    if equipid == None:
+        return None
+    return equipid.encode('ascii')
+
 class Error(Message):
     MSG_NAME = "ERROR"
     MSGID = "07"
@@ -123,6 +173,8 @@ class Error(Message):
             return "Target equipment not found"
         elif self.payload == "04":
             return "Equipment limit exceeded"
+        elif self.payload == "05":
+            return "Request throttled"
         else:
             raise ValueError(f"Unable to decode error for payload '{self.payload}'")
 
@@ -152,32 +204,52 @@ MESSAGE_BUILDERS = {
     "08": Ok,
 }
 
+# _BUILDERS is MESSAGE_BUILDERS keyed by the msgid bytes.
+_BUILDERS = {msgid.encode('ascii'): builder
+             for msgid, builder in MESSAGE_BUILDERS.items()}
+
+ROUTED_MSGIDS = {ReqInf.MSGID.encode('ascii'), ResInf.MSGID.encode('ascii')}
+
+# decode_routed returns stream as a RoutedMsg if it is a REQ_INF or RES_INF
+# with both ids, looking at its header only. Otherwise it returns None. The
+# body is forwarded as is, so it must still be one the recipient can decode:
+# ASCII, with a payload field after the header.
+def decode_routed(stream):
+    if len(stream) < ID_HEADER.size:
+        return None
+    msgid, originid, destid = ID_HEADER.unpack_from(stream)
+    if (msgid not in ROUTED_MSGIDS or originid[0] == MISSING_BYTE or
+            destid[0] == MISSING_BYTE):
+        return None
+    if len(stream) == ID_HEADER.size or not bytes(stream).isascii():
+        raise InvalidMessageError(bytes(stream))
+    return RoutedMsg(msgid, originid, destid, stream)
+
+# decode builds a message from stream, which is bytes or a memoryview. Only
+# the fields present are turned into strings.
 def decode(stream):
     if len(stream) == 0:
         raise InvalidMessageError(stream)
 
-    logger.debug(f"Decoding stream '{stream}'")
+    try:
+        builder = _BUILDERS[bytes(stream[:EQID_LEN])]
 
-    def component(stream, begin, offset=None):
-        ss = None
-        if stream[begin] == "-":
-            begin += 1
+        pos = EQID_LEN
+        originid = None
+        if stream[pos] == MISSING_BYTE:
+            pos += 1
+        else:
+            originid = str(stream[pos:pos+EQID_LEN], 'ascii').strip()
+            pos += EQID_LEN
+        destid = None
+        if stream[pos] == MISSING_BYTE:
+            pos += 1
         else:
-            if offset == None:
-                ss = stream[begin:]
-                begin = len(stream)
-            else:
-                ss = stream[begin:begin+offset]
-                begin += offset
-        if ss != None:
-            ss = ss.strip()
-        return ss, begin
-
-    stream_pos = 0
-    msgid, stream_pos = component(stream, stream_pos, EQID_LEN)
-    originid, stream_pos = component(stream, stream_pos, EQID_LEN)
-    destid, stream_pos = component(stream, stream_pos, EQID_LEN)
-    payload, stream_pos = component(stream, stream_pos)
-
-    builder = MESSAGE_BUILDERS[msgid]
+            destid = str(stream[pos:pos+EQID_LEN], 'ascii').strip()
+            pos += EQID_LEN
+        payload = None
+        if stream[pos] != MISSING_BYTE:
+            payload = str(stream[pos:], 'ascii').strip()
+    except (IndexError, KeyError, UnicodeDecodeError):
+        raise InvalidMessageError(bytes(stream))
     return builder(originid=originid, destid=destid, payload=payload)
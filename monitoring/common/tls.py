@@ -0,0 +1,67 @@
+import ssl
+import threading
+
+from . import log
+
+logger = log.logger('common-logger')
+
+# NUM_TICKETS is the number of TLS 1.3 session tickets sent after each full
+# handshake. Each ticket lets a client resume one session.
+NUM_TICKETS = 2
+
+def server_context(certfile, keyfile):
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    ctx.load_cert_chain(certfile, keyfile)
+    ctx.num_tickets = NUM_TICKETS
+    return ctx
+
+def client_context(cafile):
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    ctx.load_verify_locations(cafile)
+    return ctx
+
+# SessionCache keeps the last TLS session of each server, so that new
+# connections resume it instead of running a full handshake.
+class SessionCache:
+    def __init__(self):
+        self._mutex = threading.Lock()
+        # _sessions is map (server_addr, server_port) -> ssl.SSLSession
+        self._sessions = {}
+
+    def get(self, server_addr, server_port):
+        with self._mutex:
+            return self._sessions.get((server_addr, server_port))
+
+    def store(self, server_addr, server_port, sock):
+        # TLS 1.3 tickets arrive after the handshake, so this should be called
+        # once data was received from the server.
+        session = sock.session
+        if session == None:
+            return
+        with self._mutex:
+            self._sessions[(server_addr, server_port)] = session
+
+def wrap_client(ctx, sock, server_addr, server_port, sessions=None):
+    session = None
+    if sessions != None:
+        session = sessions.get(server_addr, server_port)
+    ssock = ctx.wrap_socket(sock, server_hostname=server_addr, session=session)
+    logger.debug(f"TLS handshake with {server_addr}:{server_port} done. "+
+                 f"Resumed: {ssock.session_reused}")
+    return ssock
+
+def wrap_server(ctx, sock, timeout):
+    # The handshake runs in the caller's thread, bounded by timeout, instead
+    # of in the thread that accepted the connection.
+    ssock = ctx.wrap_socket(sock, server_side=True,
+                            do_handshake_on_connect=False)
+    ssock.settimeout(timeout)
+    try:
+        ssock.do_handshake()
+    except Exception:
+        ssock.close()
+        raise
+    ssock.settimeout(None)
+    return ssock
@@ -1,6 +1,32 @@
+SWITCH_ON = "on"
+SWITCH_OFF = "off"
+
 def get_eqseparated_val(key, s):
     split_by_eq = s.split("=")
     if len(split_by_eq) < 2:
         raise ValueError(key, f"must be a '='-separated string. "+
                                  f"Got: {s}")
     return split_by_eq[1]
+
+def get_option(args, key, default=None):
+    for arg in args:
+        if arg.startswith(key + "="):
+            return get_eqseparated_val(key, arg)
+    return default
+
+def get_choice_option(args, key, choices, default):
+    val = get_option(args, key, default)
+    if val not in choices:
+        raise ValueError(f"Invalid value '{val}' for {key}. Should be one of "+
+                         f"{list(choices)}")
+    return val
+
+def get_switch_option(args, key, default):
+    val = get_choice_option(args, key, [SWITCH_ON, SWITCH_OFF],
+                            SWITCH_ON if default else SWITCH_OFF)
+    return val == SWITCH_ON
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1,
+                int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
@@ -0,0 +1,39 @@
+from common import log
+from common.utils import get_option, get_choice_option
+
+SPEED_REALTIME = "1"
+SPEED_MAX = "max"
+
+class Config:
+    def __init__(self, server_addr, server_port, capture, speed=SPEED_REALTIME,
+                 timeout=1.0, unix_socket=None, tls_ca=None):
+        self.server_addr = server_addr
+        self.server_port = server_port
+        # unix_socket is the path of the server's Unix socket. When set, the
+        # replay connects to it instead of server_addr and server_port.
+        self.unix_socket = unix_socket
+        # tls_ca is the certificate used to verify the server. The replay
+        # connects over TLS when it is set.
+        self.tls_ca = tls_ca
+        self.capture = capture
+        self.speed = speed
+        # timeout is how long to wait for an expected frame, in seconds.
+        self.timeout = timeout
+
+def parse_config(args):
+    min_args = 3
+    if len(args) < min_args:
+        raise ValueError(f"Need at least {min_args} arguments for the program")
+
+    server_addr = args[0]
+    server_port = int(args[1])
+    capture = args[2]
+
+    speed = get_choice_option(args, "-speed", [SPEED_REALTIME, SPEED_MAX],
+                              SPEED_REALTIME)
+    timeout = float(get_option(args, "-timeout", 1.0))
+    unix_socket = get_option(args, "-unix-socket")
+    tls_ca = get_option(args, "-tls-ca")
+
+    return Config(server_addr, server_port, capture, speed=speed,
+                  timeout=timeout, unix_socket=unix_socket, tls_ca=tls_ca)
@@ -0,0 +1,26 @@
+import sys
+
+from common import log
+from .replay import Replay
+from .config import parse_config
+
+logger = log.logger('industry50-replay')
+
+def main():
+    try:
+        log.parse_config_log_level(sys.argv[1:])
+
+        logger.info("Starting industry50 replay.")
+
+        logger.info(f"Program got arguments: {sys.argv[1:]}")
+
+        config = parse_config(sys.argv[1:])
+        replay = Replay(config)
+        replay.init()
+        replay.run()
+        replay.report()
+
+        logger.info("Successfully ran industry50 replay. Terminating gracefully.")
+
+    except Exception as e:
+        logger.critical(f"Encountered fatal error: {e}", exc_info=True)
@@ -0,0 +1,224 @@
+import collections
+import selectors
+import socket
+import time
+
+from common.capture import (read_capture,
+                            ROLE_SERVER,
+                            DIRECTION_IN,
+                            DIRECTION_OUT,
+)
+from common.comm import (new_socket,
+                         has_pending,
+                         send_frame,
+                         recv_frame,
+)
+from common import log, tls
+from common.utils import percentile
+from .config import SPEED_MAX
+from .defs import LOGGER_NAME
+
+logger = log.logger(LOGGER_NAME)
+
+class Connection:
+    def __init__(self, peer, sock):
+        self.peer = peer
+        self.sock = sock
+        # expected holds the frames the server should still send to this peer.
+        self.expected = collections.deque()
+        self.closed = False
+
+# Replay re-drives a captured session against a server. Every captured peer
+# gets its own connection. Before sending a frame, the replay waits for the
+# frames the server sent before it in the capture, so the session unfolds in
+# the same order regardless of the speed.
+class Replay:
+    MAX_REPORTED_DIVERGENCES = 10
+
+    def __init__(self, config):
+        self._config = config
+
+        self._selector = selectors.DefaultSelector()
+        self._tls_context = None
+        if config.tls_ca != None:
+            self._tls_context = tls.client_context(config.tls_ca)
+        # _conns is map peer -> Connection
+        self._conns = {}
+        self._frames = []
+        # _request_dir is the direction of frames sent by clients.
+        self._request_dir = None
+
+        self._num_sent = 0
+        self._num_matched = 0
+        self._num_expected = 0
+        self._num_mismatched = 0
+        self._num_missing = 0
+        self._num_unexpected = 0
+        self._divergences = []
+        self._latencies = []
+        self._last_send_time = None
+        self._elapsed = 0.0
+
+    def init(self):
+        role, self._frames = read_capture(self._config.capture)
+        self._frames.sort(key=lambda frame: frame.timestamp)
+        if role == ROLE_SERVER:
+            self._request_dir = DIRECTION_IN
+        else:
+            self._request_dir = DIRECTION_OUT
+        logger.info(f"Loaded {len(self._frames)} frames from "+
+                    f"'{self._config.capture}'")
+
+    def run(self):
+        logger.info(f"Replaying capture at speed {self._config.speed}")
+
+        start = time.monotonic()
+        try:
+            for frame in self._frames:
+                if frame.direction == self._request_dir:
+                    self._wait_expected()
+                    if self._config.speed != SPEED_MAX:
+                        self._sleep_until(start + frame.timestamp)
+                    self._send(frame)
+                else:
+                    self._expect(frame)
+            self._wait_expected()
+        finally:
+            self._elapsed = time.monotonic() - start
+            self._close_all()
+
+    def report(self):
+        print(f"Replayed {self._num_sent} frames over {len(self._conns)} "+
+              f"connections in {self._elapsed:.3f} s")
+        print(f"Matched {self._num_matched}/{self._num_expected} expected "+
+              f"frames")
+        num_divergences = (self._num_mismatched + self._num_missing +
+                           self._num_unexpected)
+        print(f"Divergences: {num_divergences} (mismatched "+
+              f"{self._num_mismatched}, missing {self._num_missing}, "+
+              f"unexpected {self._num_unexpected})")
+        for divergence in self._divergences:
+            print("  " + divergence)
+
+        if len(self._latencies) > 0:
+            latencies = sorted(self._latencies)
+            mean = sum(latencies) / len(latencies)
+            print("Latency (ms): mean {:.3f} p50 {:.3f} p99 {:.3f} max {:.3f}".
+                  format(mean * 1e3,
+                         percentile(latencies, 50) * 1e3,
+                         percentile(latencies, 99) * 1e3,
+                         latencies[-1] * 1e3))
+
+    def _send(self, frame):
+        conn = self._conn(frame.peer)
+        if conn.closed:
+            self._diverge(f"{frame.peer}: connection closed before sending "+
+                          f"{frame.data!r}")
+            return
+        send_frame(conn.sock, frame.data)
+        self._last_send_time = time.monotonic()
+        self._num_sent += 1
+
+    def _expect(self, frame):
+        conn = self._conn(frame.peer)
+        conn.expected.append(frame.data)
+        self._num_expected += 1
+
+    def _wait_expected(self):
+        deadline = time.monotonic() + self._config.timeout
+        while self._num_pending() > 0:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            self._service(timeout)
+
+        for conn in self._conns.values():
+            while len(conn.expected) > 0:
+                data = conn.expected.popleft()
+                self._num_missing += 1
+                self._diverge(f"{conn.peer}: missing {data!r}")
+
+    def _service(self, timeout):
+        # TLS connections may hold frames that select does not report.
+        ready = [conn for conn in self._conns.values()
+                 if not conn.closed and has_pending(conn.sock)]
+        if len(ready) > 0:
+            timeout = 0
+        for key, _ in self._selector.select(timeout):
+            if key.data not in ready:
+                ready.append(key.data)
+
+        for conn in ready:
+            try:
+                data = recv_frame(conn.sock)
+            except (ConnectionResetError, OSError) as e:
+                logger.info(f"Connection for peer {conn.peer} closed: {e}")
+                self._selector.unregister(conn.sock)
+                conn.closed = True
+                continue
+            self._check(conn, data)
+
+    def _check(self, conn, data):
+        if len(conn.expected) == 0:
+            self._num_unexpected += 1
+            self._diverge(f"{conn.peer}: unexpected {data!r}")
+            return
+
+        expected = conn.expected.popleft()
+        if data != expected:
+            self._num_mismatched += 1
+            self._diverge(f"{conn.peer}: expected {expected!r}, got {data!r}")
+            return
+
+        self._num_matched += 1
+        if self._last_send_time != None:
+            self._latencies.append(time.monotonic() - self._last_send_time)
+
+    def _diverge(self, description):
+        logger.warning(f"Divergence: {description}")
+        if len(self._divergences) < self.MAX_REPORTED_DIVERGENCES:
+            self._divergences.append(description)
+
+    def _conn(self, peer):
+        conn = self._conns.get(peer)
+        if conn != None:
+            return conn
+
+        logger.info(f"Opening connection for captured peer {peer}")
+        if self._config.unix_socket != None:
+            sock = new_socket(socket.AF_UNIX)
+            sock.connect(self._config.unix_socket)
+        else:
+            sock = new_socket()
+            sock.connect((self._config.server_addr, self._config.server_port))
+        if self._tls_context != None:
+            sock = tls.wrap_client(self._tls_context, sock,
+                                   self._config.server_addr,
+                                   self._config.server_port)
+        conn = Connection(peer, sock)
+        self._conns[peer] = conn
+        self._selector.register(sock, selectors.EVENT_READ, conn)
+        return conn
+
+    def _num_pending(self):
+        return sum(len(conn.expected) for conn in self._conns.values()
+                   if not conn.closed)
+
+    def _sleep_until(self, deadline):
+        # Keep serving the connections while waiting for the frame's time.
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            self._service(timeout)
+
+    def _close_all(self):
+        for conn in self._conns.values():
+            try:
+                if not conn.closed:
+                    self._selector.unregister(conn.sock)
+                conn.sock.close()
+            except Exception as e:
+                logger.error(f"Error closing connection for peer "+
+                             f"{conn.peer}: {e}")
+        self._selector.close()
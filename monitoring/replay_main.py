@@ -0,0 +1,4 @@
+from replay.main import main as replay_main
+
+if __name__ == '__main__':
+    replay_main()
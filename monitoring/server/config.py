@@ -1,8 +1,33 @@
 from common import log
+from common.comm import COMPRESSION_ZLIB, COMPRESSIONS
+from common.utils import get_option, get_choice_option, get_switch_option
+from .limits import REQ_INF_ORIGIN_RATE, REQ_INF_DEST_RATE, BROADCAST_WINDOW
 
 class Config:
-    def __init__(self, server_port):
+    def __init__(self, server_port, capture=None, compression=COMPRESSION_ZLIB,
+                 tls_cert=None, tls_key=None, priority_lanes=True,
+                 origin_rate=REQ_INF_ORIGIN_RATE, dest_rate=REQ_INF_DEST_RATE,
+                 broadcast_window=BROADCAST_WINDOW, unix_socket=None):
         self.server_port = server_port
+        # unix_socket is the path of a Unix socket the server also listens
+        # on, for equipments on the same host.
+        self.unix_socket = unix_socket
+        # capture is the path of the file where traffic is recorded.
+        self.capture = capture
+        self.compression = compression
+        # The server accepts TLS connections only when tls_cert and tls_key
+        # are set.
+        self.tls_cert = tls_cert
+        self.tls_key = tls_key
+        # priority_lanes sends control messages ahead of data.
+        self.priority_lanes = priority_lanes
+        # origin_rate and dest_rate limit the REQ_INF sent by and to each
+        # equipment, in requests per second. 0 means unlimited.
+        self.origin_rate = origin_rate
+        self.dest_rate = dest_rate
+        # broadcast_window is how long membership changes are coalesced, in
+        # seconds. 0 announces each change right away.
+        self.broadcast_window = broadcast_window
 
 def parse_config(args):
     min_args = 1
@@ -11,4 +36,23 @@ def parse_config(args):
 
     server_port = int(args[0])
 
-    return Config(server_port)
+    unix_socket = get_option(args, "-unix-socket")
+    capture = get_option(args, "-capture")
+    compression = get_choice_option(args, "-compression", COMPRESSIONS,
+                                    COMPRESSION_ZLIB)
+    tls_cert = get_option(args, "-tls-cert")
+    tls_key = get_option(args, "-tls-key")
+    if (tls_cert == None) != (tls_key == None):
+        raise ValueError("Options -tls-cert and -tls-key must be given together")
+    priority_lanes = get_switch_option(args, "-priority-lanes", True)
+    origin_rate = float(get_option(args, "-origin-rate", REQ_INF_ORIGIN_RATE))
+    dest_rate = float(get_option(args, "-dest-rate", REQ_INF_DEST_RATE))
+    # -broadcast-window is given in milliseconds.
+    broadcast_window = float(get_option(args, "-broadcast-window",
+                                        BROADCAST_WINDOW * 1e3)) / 1e3
+
+    return Config(server_port, capture=capture, compression=compression,
+                  tls_cert=tls_cert, tls_key=tls_key,
+                  priority_lanes=priority_lanes, origin_rate=origin_rate,
+                  dest_rate=dest_rate, broadcast_window=broadcast_window,
+                  unix_socket=unix_socket)
@@ -1,2 +1,31 @@
 MAX_CONNECTIONS = 15
 MAX_EQUIPMENTS = MAX_CONNECTIONS
+
+HANDSHAKE_TIMEOUT = 5 # Seconds
+
+# MAX_OUTBOX_BYTES bounds the frames queued for one connection. Workers
+# routing to a full outbox wait, so a peer that does not read slows down its
+# senders, as TCP would.
+MAX_OUTBOX_BYTES = 64 * 1024 # Bytes
+
+# PRIORITY_NOTSENT_LOWAT bounds the unsent data the kernel queues for
+# connections with priority lanes.
+PRIORITY_NOTSENT_LOWAT = 1024 # Bytes
+
+# Token buckets for REQ_INF, in requests per second and requests.
+REQ_INF_ORIGIN_RATE = 100.0
+REQ_INF_ORIGIN_BURST = 50
+REQ_INF_DEST_RATE = 200.0
+REQ_INF_DEST_BURST = 100
+
+# THROTTLE_REPORT_INTERVAL is how often the throttled requests are reported,
+# when they changed since the last report.
+THROTTLE_REPORT_INTERVAL = 10 # Seconds
+
+# BROADCAST_WINDOW is how long membership changes are coalesced before being
+# announced.
+BROADCAST_WINDOW = 0.01 # Seconds
+
+# DRR_QUANTUM is the number of bytes each origin may add to a connection's data
+# lane per round.
+DRR_QUANTUM = 64 # Bytes
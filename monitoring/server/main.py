@@ -1,12 +1,14 @@
 import sys
 
-from common import log
+from common import comm, log
+from common.capture import Capture, ROLE_SERVER
 from .server import Server
 from .config import parse_config
 
 logger = log.logger('industry50-server')
 
 def main():
+    capture = None
     try:
         log.parse_config_log_level(sys.argv[1:])
 
@@ -15,6 +17,11 @@ def main():
         logger.info(f"Program got arguments: {sys.argv[1:]}")
 
         config = parse_config(sys.argv[1:])
+        if config.capture != None:
+            logger.info(f"Capturing traffic to '{config.capture}'")
+            capture = Capture(config.capture, ROLE_SERVER)
+            comm.set_capture(capture)
+
         server = Server(config)
         server.init()
         server.run()
@@ -23,3 +30,7 @@ def main():
 
     except Exception as e:
         logger.critical(f"Encountered fatal error: {e}", exc_info=True)
+    finally:
+        if capture != None:
+            comm.set_capture(None)
+            capture.close()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from common.message import ResAdd, ReqRem
+from common import log
+from .defs import LOGGER_NAME
+
+logger = log.logger(LOGGER_NAME)
+
+# Membership announces the equipments joining and leaving to the others.
+# Changes are coalesced over a window, so each equipment gets at most one
+# RES_ADD and one REQ_REM per window, listing every id added or removed in it.
+# With a window of 0 each change is announced right away. Announcements are
+# queued while holding locks, so they never wait for a full outbox.
+class Membership:
+    def __init__(self, window):
+        self._window = window
+
+        self._cond = threading.Condition()
+        # _outboxes is map equipid -> Outbox of the equipments announced to.
+        self._outboxes = {}
+        # _added and _removed are map recipient equipid -> dict of equipids
+        # not announced to the recipient yet. The dicts are used as ordered
+        # sets, so ids are announced in the order they changed.
+        self._added = {}
+        self._removed = {}
+        self._pending = False
+
+        if window > 0:
+            flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            flusher.start()
+
+    def add(self, equipid, outbox):
+        with self._cond:
+            if self._window == 0:
+                self._announce(ResAdd(payload=equipid), self._outboxes.values())
+            else:
+                for recipient in self._outboxes:
+                    removed = self._removed[recipient]
+                    if equipid in removed:
+                        # The id was reused within the window, so the
+                        # recipient's list is already right.
+                        del removed[equipid]
+                    else:
+                        self._added[recipient][equipid] = None
+                self._pending = True
+                self._cond.notify()
+
+            self._outboxes[equipid] = outbox
+            self._added[equipid] = {}
+            self._removed[equipid] = {}
+
+    def remove(self, equipid, announce=True):
+        with self._cond:
+            if self._outboxes.pop(equipid, None) == None:
+                return
+            del self._added[equipid]
+            del self._removed[equipid]
+
+            if self._window == 0:
+                if announce:
+                    self._announce(ReqRem(originid=equipid),
+                                   self._outboxes.values())
+                return
+
+            for recipient in self._outboxes:
+                added = self._added[recipient]
+                if equipid in added:
+                    # The recipient never heard of the equipment.
+                    del added[equipid]
+                elif announce:
+                    self._removed[recipient][equipid] = None
+            self._pending = True
+            self._cond.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Changes made during the window go in the same frames.
+            time.sleep(self._window)
+            with self._cond:
+                self._flush()
+
+    def _flush(self):
+        # bodies is map (msgid, equipids) -> encoded message, as recipients
+        # mostly share the same changes.
+        bodies = {}
+        for recipient, outbox in self._outboxes.items():
+            removed = self._removed[recipient]
+            if len(removed) > 0:
+                self._put(outbox, ReqRem, tuple(removed), bodies)
+                removed.clear()
+            added = self._added[recipient]
+            if len(added) > 0:
+                self._put(outbox, ResAdd, tuple(added), bodies)
+                added.clear()
+        self._pending = False
+
+    def _put(self, outbox, msg_type, equipids, bodies):
+        key = (msg_type.MSGID, equipids)
+        body = bodies.get(key)
+        if body == None:
+            body = batch_msg(msg_type, equipids).encode()
+            bodies[key] = body
+        outbox.put(msg_type.PRIORITY, body, block=False)
+
+    def _announce(self, msg, outboxes):
+        logger.debug("Announcing message: {}".format(msg))
+        body = msg.encode()
+        for outbox in outboxes:
+            outbox.put(msg.PRIORITY, body, block=False)
+
+# batch_msg builds a RES_ADD or REQ_REM for equipids. A single id is sent in
+# the same form as an unbatched message.
+def batch_msg(msg_type, equipids):
+    if msg_type == ReqRem and len(equipids) == 1:
+        return ReqRem(originid=equipids[0])
+    return msg_type(payload=" ".join(equipids))
@@ -0,0 +1,118 @@
+import collections
+import socket
+import threading
+
+from common.comm import encode_frame, send_frame
+from common.message import PRIORITY_CONTROL, PRIORITY_DATA
+from common import log
+from .defs import LOGGER_NAME
+from .limits import PRIORITY_NOTSENT_LOWAT, DRR_QUANTUM, MAX_OUTBOX_BYTES
+from .scheduler import DeficitRoundRobin
+
+logger = log.logger(LOGGER_NAME)
+
+# Outbox queues the frames sent to one connection, one lane per priority. A
+# writer thread sends them, emptying the control lane before the data lane,
+# so control messages never wait behind bulk data. The data lane is shared
+# among origins in deficit round robin. At most max_queued bytes are queued;
+# beyond that, put blocks until the writer catches up.
+class Outbox:
+    def __init__(self, sock, prioritize=True, max_queued=MAX_OUTBOX_BYTES):
+        self._sock = sock
+        self._prioritize = prioritize
+        if (prioritize and hasattr(socket, "TCP_NOTSENT_LOWAT") and
+                sock.family != socket.AF_UNIX):
+            # Frames waiting in the kernel can not be reordered anymore, so
+            # keep that queue short.
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT,
+                            PRIORITY_NOTSENT_LOWAT)
+        # compress tells whether the peer accepts compressed frames.
+        self.compress = False
+
+        self._mutex = threading.Lock()
+        # _cond wakes the writer up, _space the callers of put.
+        self._cond = threading.Condition(self._mutex)
+        self._space = threading.Condition(self._mutex)
+        self._control = collections.deque()
+        self._data = DeficitRoundRobin(DRR_QUANTUM)
+        self._max_queued = max_queued
+        self._queued = 0
+        self._closing = False
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def put_msg(self, msg, block=True):
+        return self.put(msg.PRIORITY, msg.encode(), flow=msg.originid,
+                        block=block)
+
+    # put returns False if the outbox is closed. Callers holding locks pass
+    # block=False, which queues the body even if the outbox is full.
+    def put(self, priority, body, flow=None, block=True):
+        if not self._prioritize:
+            priority = PRIORITY_CONTROL
+        with self._mutex:
+            while (block and not self._closing and
+                   self._queued >= self._max_queued):
+                self._space.wait()
+            if self._closing:
+                return False
+            if priority == PRIORITY_DATA:
+                self._data.push(flow, body, len(body))
+            else:
+                self._control.append(body)
+            self._queued += len(body)
+            self._cond.notify()
+        return True
+
+    def close(self):
+        # Frames already queued are still sent, then the socket is closed.
+        with self._mutex:
+            self._closing = True
+            self._cond.notify()
+            self._space.notify_all()
+
+    def sock(self):
+        return self._sock
+
+    def _next_body(self):
+        with self._mutex:
+            while True:
+                body = None
+                if len(self._control) > 0:
+                    body = self._control.popleft()
+                elif len(self._data) > 0:
+                    body = self._data.pop()
+                if body != None:
+                    self._queued -= len(body)
+                    self._space.notify_all()
+                    return body
+                if self._closing:
+                    return None
+                self._cond.wait()
+
+    def _write_loop(self):
+        try:
+            while True:
+                body = self._next_body()
+                if body == None:
+                    break
+                send_frame(self._sock, encode_frame(body, self.compress))
+        except Exception as e:
+            logger.info(f"Error sending to socket {self._sock}: {e}")
+            with self._mutex:
+                self._closing = True
+                self._control.clear()
+                self._data.clear()
+                self._queued = 0
+                self._space.notify_all()
+
+        try:
+            # shutdown wakes up the worker blocked reading from the socket.
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self._sock.close()
+        except Exception as e:
+            logger.error(f"Error closing socket: {e}")
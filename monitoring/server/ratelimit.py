@@ -0,0 +1,87 @@
+import threading
+import time
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last = now
+
+    def has_token(self, now):
+        self._tokens = min(self._burst,
+                           self._tokens + (now - self._last) * self._rate)
+        self._last = now
+        return self._tokens >= 1
+
+    def take(self):
+        self._tokens -= 1
+
+# RateLimiter throttles requests with one token bucket per origin and one per
+# destination. A rate of 0 disables the corresponding buckets.
+class RateLimiter:
+    def __init__(self, origin_rate, origin_burst, dest_rate, dest_burst):
+        self._origin_rate = origin_rate
+        self._origin_burst = origin_burst
+        self._dest_rate = dest_rate
+        self._dest_burst = dest_burst
+
+        self._mutex = threading.Lock()
+        # _origin_buckets and _dest_buckets are map equipid -> TokenBucket
+        self._origin_buckets = {}
+        self._dest_buckets = {}
+        # _throttled_origins and _throttled_dests are map equipid -> number of
+        # requests throttled.
+        self._throttled_origins = {}
+        self._throttled_dests = {}
+
+    def allow(self, originid, destid):
+        now = time.monotonic()
+        with self._mutex:
+            origin_bucket = None
+            if self._origin_rate > 0:
+                origin_bucket = self._bucket(self._origin_buckets, originid,
+                                             self._origin_rate,
+                                             self._origin_burst, now)
+                if not origin_bucket.has_token(now):
+                    self._count(self._throttled_origins, originid)
+                    return False
+            dest_bucket = None
+            if self._dest_rate > 0:
+                dest_bucket = self._bucket(self._dest_buckets, destid,
+                                           self._dest_rate, self._dest_burst,
+                                           now)
+                if not dest_bucket.has_token(now):
+                    self._count(self._throttled_dests, destid)
+                    return False
+
+            # Tokens are only taken once both buckets allow the request, so
+            # a busy destination does not drain its origins.
+            if origin_bucket != None:
+                origin_bucket.take()
+            if dest_bucket != None:
+                dest_bucket.take()
+        return True
+
+    def forget(self, equipid):
+        # Removed equipments free their id, so the next owner starts afresh.
+        with self._mutex:
+            self._origin_buckets.pop(equipid, None)
+            self._dest_buckets.pop(equipid, None)
+
+    def counters(self):
+        with self._mutex:
+            return {
+                "origin": dict(self._throttled_origins),
+                "destination": dict(self._throttled_dests),
+            }
+
+    def _bucket(self, buckets, equipid, rate, burst, now):
+        bucket = buckets.get(equipid)
+        if bucket == None:
+            bucket = TokenBucket(rate, burst, now)
+            buckets[equipid] = bucket
+        return bucket
+
+    def _count(self, counters, equipid):
+        counters[equipid] = counters.get(equipid, 0) + 1
@@ -0,0 +1,53 @@
+import collections
+
+# DeficitRoundRobin is a queue shared by several flows. Flows are served in
+# turns, and each turn a flow may send up to quantum more bytes. A flow with a
+# long backlog thus gets the same share as the others, not all of it.
+class DeficitRoundRobin:
+    def __init__(self, quantum):
+        self._quantum = quantum
+        # _queues is map flow -> deque of (item, cost)
+        self._queues = {}
+        self._deficits = {}
+        # _active holds the flows with queued items, in serving order.
+        self._active = collections.deque()
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def push(self, flow, item, cost):
+        queue = self._queues.get(flow)
+        if queue == None:
+            queue = collections.deque()
+            self._queues[flow] = queue
+            self._deficits[flow] = 0
+            self._active.append(flow)
+        queue.append((item, cost))
+        self._len += 1
+
+    def pop(self):
+        while len(self._active) > 0:
+            flow = self._active[0]
+            queue = self._queues[flow]
+            item, cost = queue[0]
+            if self._deficits[flow] >= cost:
+                self._deficits[flow] -= cost
+                queue.popleft()
+                self._len -= 1
+                if len(queue) == 0:
+                    # Idle flows do not keep their deficit.
+                    del self._queues[flow]
+                    del self._deficits[flow]
+                    self._active.popleft()
+                return item
+
+            self._deficits[flow] += self._quantum
+            self._active.rotate(-1)
+        return None
+
+    def clear(self):
+        self._queues.clear()
+        self._deficits.clear()
+        self._active.clear()
+        self._len = 0
@@ -1,9 +1,17 @@
+import selectors
+import socket
+import ssl
 import threading
+import time
 
 from common.comm import (new_socket,
-                         recv_msg,
-                         send_msg)
-from common.message import (ReqAdd,
+                         remove_stale_socket,
+                         recv_body,
+                         COMPRESSION_ZLIB)
+from common.message import (decode as decode_msg,
+                            decode_routed,
+                            RoutedMsg,
+                            ReqAdd,
                             ReqRem,
                             ResAdd,
                             ResList,
@@ -16,52 +24,136 @@ from common.code import (CODE_EQUIPMENT_NOT_FOUND,
                          CODE_SOURCE_EQUIPMENT_NOT_FOUND,
                          CODE_TARGET_EQUIPMENT_NOT_FOUND,
                          CODE_EQUIPMENT_LIMIT_EXCEEDED,
+                         CODE_REQUEST_THROTTLED,
 
                          CODE_SUCCESSFUL_REMOVAL,
 )
 from common.errors import InvalidMessageError
-from common import log
-from .limits import MAX_CONNECTIONS, MAX_EQUIPMENTS
+from common import log, tls
+from .limits import (MAX_CONNECTIONS,
+                     MAX_EQUIPMENTS,
+                     HANDSHAKE_TIMEOUT,
+                     REQ_INF_ORIGIN_BURST,
+                     REQ_INF_DEST_BURST,
+                     THROTTLE_REPORT_INTERVAL,
+)
 from .defs import LOGGER_NAME
+from .outbox import Outbox
+from .membership import Membership
+from .ratelimit import RateLimiter
 
 logger = log.logger(LOGGER_NAME)
 
+REQ_INF_MSGID = ReqInf.MSGID.encode('ascii')
+
+def decode_id(equipid):
+    if equipid == None:
+        return None
+    try:
+        return equipid.decode('ascii')
+    except UnicodeDecodeError:
+        raise InvalidMessageError(equipid)
+
 class Server:
     def __init__(self, config):
         self._port = config.server_port
+        self._unix_socket = config.unix_socket
+        self._compression = config.compression
+        self._tls_cert = config.tls_cert
+        self._tls_key = config.tls_key
+        self._priority_lanes = config.priority_lanes
+        self._origin_rate = config.origin_rate
+        self._dest_rate = config.dest_rate
+        self._broadcast_window = config.broadcast_window
 
     def init(self):
         self._sock = new_socket()
+        self._unix_sock = None
+        if self._unix_socket != None:
+            self._unix_sock = new_socket(socket.AF_UNIX)
+
+        self._tls_context = None
+        if self._tls_cert != None:
+            self._tls_context = tls.server_context(self._tls_cert,
+                                                   self._tls_key)
 
-        # Used as global mutex for client_socks and free_equipids objects
+        # Used as global mutex for outboxes and free_equipids objects
         self._salt_mutex = threading.Lock()
 
-        # _client_socks is map equipid -> socket
-        self._client_socks = {}
+        # _outboxes is map equipid -> Outbox
+        self._outboxes = {}
+        # _routes is map equipid -> Outbox too, with ids as bytes, as REQ_INF
+        # and RES_INF are routed on their header bytes.
+        self._routes = {}
+
+        # _membership announces equipments joining and leaving. It is only
+        # updated while holding _salt_mutex.
+        self._membership = Membership(self._broadcast_window)
+
+        # _limiter throttles REQ_INF per origin and per destination.
+        self._limiter = RateLimiter(self._origin_rate, REQ_INF_ORIGIN_BURST,
+                                    self._dest_rate, REQ_INF_DEST_BURST)
 
         self._free_equipids = ["{:02d}".format(i)
                                # i \in {1, 2, ..., MAX_EQUIPMENTS}
                                for i in range(1, MAX_EQUIPMENTS+1)]
 
     def run(self):
+        selector = selectors.DefaultSelector()
+        if self._unix_sock != None:
+            remove_stale_socket(self._unix_socket)
+            self._unix_sock.bind(self._unix_socket)
+            self._unix_sock.listen(MAX_CONNECTIONS)
+            selector.register(self._unix_sock, selectors.EVENT_READ)
+            logger.info(f"Listening on Unix socket '{self._unix_socket}'")
+
         # bind "" == bind INADDR_ANY
         self._sock.bind(("", self._port))
         self._sock.listen(MAX_CONNECTIONS)
+        selector.register(self._sock, selectors.EVENT_READ)
+
+        reporter = threading.Thread(target=self._report_throttling, daemon=True)
+        reporter.start()
 
         try:
             while True:
-                self._accept_conn()
+                for key, _ in selector.select():
+                    self._accept_conn(key.fileobj)
 
         except Exception as e:
             logger.critical(f"Received unexpected error: {e}", exc_info=True)
         finally:
+            logger.info(f"Throttled requests: {self.throttle_counters()}")
+            selector.close()
             try:
                 self._sock.close()
+                if self._unix_sock != None:
+                    self._unix_sock.close()
+                    remove_stale_socket(self._unix_socket)
             except Exception as e:
                 logger.error(f"Error trying to close socket: {e}")
 
-    def _accept_conn(self):
-        client_sock, client_addr = self._sock.accept()
+    # _report_throttling logs the throttled requests while the server runs,
+    # whenever they changed, so operators can tell who is being throttled.
+    def _report_throttling(self):
+        reported = self.throttle_counters()
+        while True:
+            time.sleep(THROTTLE_REPORT_INTERVAL)
+            counters = self.throttle_counters()
+            if counters != reported:
+                logger.warning(f"Throttled requests: {counters}")
+                reported = counters
+
+    def throttle_counters(self):
+        # The limiter sees the ids of the routing path, which are bytes.
+        return {kind: {equipid.decode('ascii'): num_throttled
+                       for equipid, num_throttled in counters.items()}
+                for kind, counters in self._limiter.counters().items()}
+
+    def _accept_conn(self, listener):
+        client_sock, client_addr = listener.accept()
+        if listener == self._unix_sock:
+            client_addr = f"unix:{self._unix_socket}"
         logger.info(f"Received connection from address {client_addr}")
 
         self._dispatch_worker(client_sock, client_addr)
@@ -79,175 +171,163 @@ class Server:
             tid, client_addr))
 
         equipid = None
+        outbox = None
         try:
+            if self._tls_context != None:
+                client_sock = tls.wrap_server(self._tls_context, client_sock,
+                                              HANDSHAKE_TIMEOUT)
+                logger.info(f"({tid}) TLS handshake done. Resumed: "+
+                            f"{client_sock.session_reused}")
+
+            outbox = Outbox(client_sock, prioritize=self._priority_lanes)
             done = False
             while not done:
-                req = recv_msg(client_sock)
-                done, new_equipid = self._process_request(client_sock, req)
+                req = self._recv_request(client_sock)
+                done, new_equipid = self._process_request(outbox, req)
                 if equipid == None:
                     equipid = new_equipid
+            outbox.close()
         except ConnectionResetError as e:
             logger.info(f"({tid}) Peer reset connection: {e}")
-            self._cleanup_sock(equipid, client_sock)
+            self._cleanup_sock(equipid, client_sock, outbox)
         except InvalidMessageError as e:
             logger.info(f"({tid}) Received invalid message: {e}")
-            self._cleanup_sock(equipid, client_sock)
+            self._cleanup_sock(equipid, client_sock, outbox)
+        except (ssl.SSLError, TimeoutError) as e:
+            logger.info(f"({tid}) TLS error: {e}")
+            self._cleanup_sock(equipid, client_sock, outbox)
         except Exception as e:
             logger.error(f"({tid}) Caught unexpected exception: {e}",
                             exc_info=True)
-            self._cleanup_sock(equipid, client_sock)
+            self._cleanup_sock(equipid, client_sock, outbox)
 
         logger.info("({}) Ended communication with client address '{}'".format(
             tid, client_addr))
 
-    def _process_request(self, sock, req):
+    def _recv_request(self, sock):
+        body = recv_body(sock)
+        req = decode_routed(body)
+        if req == None:
+            req = decode_msg(body)
+        return req
+
+    def _process_request(self, outbox, req):
         if isinstance(req, ReqAdd):
             num_open_connections = self._num_open_connections()
             if num_open_connections >= MAX_CONNECTIONS:
                 resp = Error(destid="{}".format(num_open_connections),
                              payload=CODE_EQUIPMENT_LIMIT_EXCEEDED.id)
-                send_msg(sock, resp)
+                outbox.put_msg(resp)
                 return True, None
 
-            added_equipid = self._add_equipid(sock)
+            compress = (self._compression == COMPRESSION_ZLIB and
+                        COMPRESSION_ZLIB in req.codecs())
+            outbox.compress = compress
+            added_equipid = self._add_equipid(outbox)
             print("Equipment {} added".format(added_equipid))
-            resp = ResAdd(payload=added_equipid)
-            self._broadcast(resp)
-
-            equipids = self._get_equipids()
-            equipids.remove(added_equipid)
-            resp = ResList(payload=" ".join(equipids))
-            send_msg(sock, resp)
 
             return False, added_equipid
         elif isinstance(req, ReqRem):
             equipid = req.originid
-            equip_exists = self._rmv_equipid(equipid)
+            equip_exists = self._rmv_equipid(equipid, announce=True)
             if not equip_exists:
                 resp = Error(payload=CODE_EQUIPMENT_NOT_FOUND.id)
-                send_msg(sock, resp)
+                outbox.put_msg(resp)
             else:
                 resp = Ok(destid=equipid, payload=CODE_SUCCESSFUL_REMOVAL.id)
-                send_msg(sock, resp)
-                self._cleanup_sock(equipid, sock)
-
-            resp_rem = ReqRem(originid=equipid)
-            self._broadcast(resp_rem)
+                outbox.put_msg(resp)
 
             return True, None
-        elif isinstance(req, ReqInf):
-            originid = req.originid
-            destid = req.destid
-            equip_exists = self._equipid_exists(originid)
-            if originid == destid or not equip_exists:
-                print("Equipment {} not found".format(originid))
-                resp = Error(destid=originid,
-                             payload=CODE_SOURCE_EQUIPMENT_NOT_FOUND.id)
-                send_msg(sock, resp)
-            else:
-                equip_exists = self._equipid_exists(destid)
-                if not equip_exists:
-                    print("Equipment {} not found".format(destid))
-                    resp = Error(destid=destid,
-                                 payload=CODE_TARGET_EQUIPMENT_NOT_FOUND.id)
-                    send_msg(sock, resp)
-                else:
-                    self._send(destid, req)
-        elif isinstance(req, ResInf):
-            originid = req.originid
-            destid = req.destid
-            equip_exists = self._equipid_exists(originid)
-            if originid == destid or not equip_exists:
-                print("Equipment {} not found".format(originid))
-                resp = Error(destid=originid,
-                             payload=CODE_SOURCE_EQUIPMENT_NOT_FOUND.id)
-                send_msg(sock, resp)
-            else:
-                equip_exists = self._equipid_exists(destid)
-                if not equip_exists:
-                    print("Equipment {} not found".format(destid))
-                    resp = Error(destid=destid,
-                                 payload=CODE_TARGET_EQUIPMENT_NOT_FOUND.id)
-                    send_msg(sock, resp)
-                else:
-                    self._send(destid, req)
+        elif isinstance(req, RoutedMsg):
+            self._route(outbox, req)
+        elif isinstance(req, (ReqInf, ResInf)):
+            # Only requests missing an id are decoded. They are answered as
+            # the routed ones.
+            self._route(outbox, RoutedMsg.from_msg(req))
         else:
             raise ValueError("Received unexpected request type: {}".format(req))
 
         return False, None
 
-    def _send(self, equipid, msg):
+    def _route(self, outbox, req):
+        originid = req.originid
+        destid = req.destid
         self._salt_mutex.acquire()
-        if equipid not in self._client_socks:
-            logger.error(f"No socket associated with equipment id "+
-                         f"'{equipid}'")
-            self._salt_mutex.release()
-            return
-        try:
-            client_sock = self._client_socks[equipid]
-            send_msg(client_sock, msg)
-        except Exception as e:
-            logger.error(f"Error sending message to socket for equipment "+
-                         f"id {equipid}: {e}")
-        finally:
-            self._salt_mutex.release()
-
-    def _broadcast(self, msg, except_equipid=None):
-        self._salt_mutex.acquire()
-        logger.debug("Broadcasting message: {}".format(msg))
-        for equipid in self._client_socks:
-            if except_equipid == equipid:
-                continue
-            logger.debug("Sending message to socket {}".format(equipid))
-            send_msg(self._client_socks[equipid], msg)
-        logger.debug("Successfully performed broadcast")
+        origin_exists = originid in self._routes
+        dest_outbox = self._routes.get(destid)
         self._salt_mutex.release()
 
-    def _cleanup_sock(self, equipid, sock):
+        if originid == destid or not origin_exists:
+            originid = decode_id(originid)
+            print("Equipment {} not found".format(originid))
+            resp = Error(destid=originid,
+                         payload=CODE_SOURCE_EQUIPMENT_NOT_FOUND.id)
+            outbox.put_msg(resp)
+        elif dest_outbox == None:
+            destid = decode_id(destid)
+            print("Equipment {} not found".format(destid))
+            resp = Error(destid=destid,
+                         payload=CODE_TARGET_EQUIPMENT_NOT_FOUND.id)
+            outbox.put_msg(resp)
+        elif (req.msgid == REQ_INF_MSGID and
+              not self._limiter.allow(originid, destid)):
+            logger.debug(f"Throttled request from {decode_id(originid)} to "+
+                         f"{decode_id(destid)}")
+            resp = Error(destid=decode_id(originid),
+                         payload=CODE_REQUEST_THROTTLED.id)
+            outbox.put_msg(resp)
+        elif not dest_outbox.put(req.PRIORITY, req.body, flow=originid):
+            logger.error(f"Error sending message to socket for equipment "+
+                         f"id {destid}: connection closed")
+
+    def _cleanup_sock(self, equipid, sock, outbox=None):
         try:
             self._rmv_equipid(equipid)
-            sock.close()
+            if outbox != None:
+                outbox.close()
+            else:
+                sock.close()
         except Exception as e:
             logger.error("Error cleaning up: {}".format(e))
 
-    def _add_equipid(self, client_sock):
+    def _add_equipid(self, outbox):
         self._salt_mutex.acquire()
         assert len(self._free_equipids) > 0
         equipid = self._free_equipids.pop(0)
-        self._client_socks[equipid] = client_sock
+        equipids = list(self._outboxes.keys())
+        self._outboxes[equipid] = outbox
+        self._routes[equipid.encode('ascii')] = outbox
+
+        # The new equipment gets its id and the list before any announcement
+        # of later changes, so they are queued while holding the mutex.
+        outbox.put_msg(ResAdd(payload=equipid), block=False)
+        outbox.put_msg(ResList(payload=" ".join(equipids)), block=False)
+        self._membership.add(equipid, outbox)
         self._salt_mutex.release()
         return equipid
 
-    def _rmv_equipid(self, equipid):
+    def _rmv_equipid(self, equipid, announce=False):
         self._salt_mutex.acquire()
 
-        if equipid not in self._client_socks:
+        if equipid not in self._outboxes:
             self._salt_mutex.release()
             return False
 
-        assert len(self._client_socks) > 0
-        self._client_socks.pop(equipid)
+        assert len(self._outboxes) > 0
+        self._outboxes.pop(equipid)
+        self._routes.pop(equipid.encode('ascii'))
+        # The id is forgotten before it can be reused.
+        self._limiter.forget(equipid.encode('ascii'))
         self._free_equipids.append(equipid)
+        self._membership.remove(equipid, announce)
         logger.debug(f"Equipment id {equipid} removed")
 
         self._salt_mutex.release()
 
         return True
 
-    def _equipid_exists(self, equipid):
-        self._salt_mutex.acquire()
-        exists = equipid in self._client_socks
-        self._salt_mutex.release()
-        return exists
-
-    def _get_equipids(self):
-        self._salt_mutex.acquire()
-        equipids = list(self._client_socks.keys())
-        self._salt_mutex.release()
-        return equipids
-
     def _num_open_connections(self):
         self._salt_mutex.acquire()
-        len_client_socks = len(self._client_socks)
+        num_outboxes = len(self._outboxes)
         self._salt_mutex.release()
-        return len_client_socks
+        return num_outboxes
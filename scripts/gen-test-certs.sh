@@ -0,0 +1,14 @@
+#!/usr/bin/bash
+
+# Generates a self-signed certificate for localhost, for tests only.
+# Usage: gen-test-certs.sh <output_dir>
+
+out_dir=$1
+
+[ -z "$out_dir" ] && echo Empty argument "'out_dir'" && exit 1
+
+mkdir -p $out_dir
+openssl req -x509 -newkey ec -pkeyopt ec_paramgen_curve:prime256v1 -nodes \
+    -days 365 -subj "/CN=localhost" \
+    -addext "subjectAltName=DNS:localhost,IP:127.0.0.1" \
+    -keyout $out_dir/test-key.pem -out $out_dir/test-cert.pem 2> /dev/null